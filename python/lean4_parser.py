@@ -6,8 +6,43 @@ Simple LEAN 4 Parser - Extracts definitions in the exact requested format
 import os
 import re
 import json, csv
+import mmap
+import pickle
+import hashlib
+import multiprocessing as mp
+from functools import partial
+from itertools import chain
+from json.encoder import encode_basestring
 from pathlib import Path
 
+# Pattern to match lemma/theorem/def declarations (bytes, matched against the raw file)
+_DECL_RE = re.compile(
+    rb'^(?P<indent>[ \t]*)'  # Capture indentation (never spans blank lines)
+    rb'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Optional attributes like @[simp]
+    rb'(?:private\s+|protected\s+|noncomputable\s+)*'  # Optional modifiers
+    rb'(?P<def_type>lemma|theorem|def)\s+'  # Declaration type
+    rb'(?P<name>[^\s\(\[:]+)'  # Name (stop at space, paren, bracket, colon)        
+    rb'(?P<type_instance>(?:\s*(?:\{[^}]*\}|\[[^\]]*\]|\([^)]*\)))+)'  # Optional type instances, like [∀ i, T2Space (H i)]
+    rb'\s*:\s*'  # Colon separator
+    rb'(?P<proof>[^\n]*?)(?=\s*(?::=|where\b|by\b)|$)',  # Type/statement, up to end of line
+    re.MULTILINE | re.DOTALL
+)
+
+# Cheap prefilter for _DECL_RE: a line whose first token can begin a
+# declaration. The leading literal newline lets the engine skip ahead with a
+# fast character search instead of trying the full pattern at every offset
+_DECL_START_RE = re.compile(rb'\n[ \t]*(?=@\[|private|protected|noncomputable|lemma|theorem|def)')
+
+# Output columns, in the order every entry is built. Each entry is a plain
+# tuple in this order until it is written out
+_FIELDS = ("attributes", "definition_type", "name", "instances", "proof", "file", "line_number")
+_TYPE = _FIELDS.index("definition_type")
+_FILE = _FIELDS.index("file")
+
+# Mixed into every cache key; bump it whenever the extracted entries change
+# shape or content so stale cache files are simply never hit again
+_CACHE_SALT = b"lean4_parser-2"
+
 def clean_up_params(m):
     ws = m.group(0)
     if '\n' in ws:
@@ -15,117 +50,336 @@ def clean_up_params(m):
     else:
         return ' '   # Other whitespace becomes single space
 
-def parse_lean_files(directory):
-    """Parse all .lean files recursively and extract lemmas, theorems, and defs."""
+def _cache_path(cache_dir, content):
+    """Cache file for a file's raw bytes, keyed by their BLAKE2 digest."""
+    digest = hashlib.blake2b(_CACHE_SALT, digest_size=16)
+    digest.update(content)
+    return Path(cache_dir) / f"{digest.hexdigest()}.pickle"
+
+def _load_cached(cache_file, lean_file):
+    """Return the cached entries stamped with lean_file, or None on a miss."""
+    file_name = str(lean_file)
+    try:
+        with open(cache_file, 'rb') as f:
+            entries = pickle.load(f)
+        
+        # Identical contents may live under several paths
+        return [entry[:_FILE] + (file_name,) + entry[_FILE + 1:] for entry in entries]
+    except Exception:
+        # Missing, truncated or not ours (unpickling a damaged file can raise
+        # almost anything); the caller re-parses and overwrites it
+        return None
+
+def _store_cached(cache_file, entries):
+    """Write entries to the cache; a failure only costs a re-parse next run."""
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic, so a concurrent reader never sees a partial file
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Error caching {cache_file}: {e}")
+
+def _strip_comments(content):
+    """Remove line (--) and block (/- -/) comments in one left-to-right pass.
+    
+    Same result as re.sub(rb'--[^\\n]*|/-.*?-/', b'', content, flags=re.DOTALL),
+    but the comment openers are located with plain substring searches, which
+    skip through comment-free code far faster than the regex engine can.
+    """
+    pieces = []
+    pos = 0
+    line = content.find(b'--')
+    block = content.find(b'/-')
+    
+    while line != -1 or block != -1:
+        if block != -1 and (line == -1 or block < line):
+            close = content.find(b'-/', block + 2)
+            if close == -1:
+                # Unterminated, and so is every later block opener
+                block = -1
+                continue
+            start, end = block, close + 2
+        else:
+            newline = content.find(b'\n', line + 2)
+            start, end = line, len(content) if newline == -1 else newline
+        
+        pieces.append(content[pos:start])
+        pos = end
+        
+        # Openers inside the removed comment no longer count
+        if line != -1 and line < end:
+            line = content.find(b'--', end)
+        if block != -1 and block < end:
+            block = content.find(b'/-', end)
+    
+    pieces.append(content[pos:])
+    return b''.join(pieces)
+
+def _iter_declarations(content):
+    """Yield the same matches as _DECL_RE.finditer(content), trying the full
+    pattern only at lines the prefilter accepts."""
+    end = 0
+    
+    # The first line has no newline before it, so it is always a candidate
+    candidates = chain((0,), (m.start() + 1 for m in _DECL_START_RE.finditer(content)))
+    
+    for start in candidates:
+        # Matches never overlap, exactly as with finditer
+        if start < end:
+            continue
+        
+        match = _DECL_RE.match(content, start)
+        if match:
+            end = match.end()
+            yield match
+
+def _parse_one_file(lean_file, cache_dir=None):
+    """Parse a single .lean file and extract its lemmas, theorems, and defs,
+    as tuples in _FIELDS order.
+    
+    With a cache_dir, results are reused for any file whose exact contents
+    were parsed before.
+    """
     
     results = []
+    cache_file = None
     
-    # Pattern to match lemma/theorem/def declarations
-    pattern = re.compile(
-        r'^(?P<indent>\s*)'  # Capture indentation
-        r'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Optional attributes like @[simp]
-        r'(?:private\s+|protected\s+|noncomputable\s+)*'  # Optional modifiers
-        r'(?P<def_type>lemma|theorem|def)\s+'  # Declaration type
-        r'(?P<name>[^\s\(\[:]+)'  # Name (stop at space, paren, bracket, colon)        
-        r'(?P<type_instance>(?:\s*(?:\{[^}]*\}|\[[^\]]*\]|\([^)]*\)))+)'  # Optional type instances, like [∀ i, T2Space (H i)]
-        r'\s*:\s*'  # Colon separator
-        r'(?P<proof>.*?)(?=\s*:=|\s*where\b|\s*by\b|$)',  # Type/statement
-        re.MULTILINE | re.DOTALL
-    )
-    
-    # Extract local instances (letI and haveI)    
-    local_pattern = re.compile(r'^.*\b(letI|haveI)\b.*$', re.MULTILINE)
-
-    # Find all .lean files recursively
-    for lean_file in Path(directory).rglob("*.lean"):
-        try:
-            with open(lean_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Remove comments for cleaner parsing
-            content = re.sub(r'--[^\n]*', '', content)
-            content = re.sub(r'/-.*?-/', '', content, flags=re.DOTALL)
+    try:
+        # Map the file and scan its bytes directly; only the captured groups
+        # are ever decoded
+        with open(lean_file, 'rb') as f:
+            # mmap rejects empty files, which have nothing to parse anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return results
             
-            # Find all matches
-            for match in pattern.finditer(content):
-                attribs = re.sub(r'\s+$', '', match.group('attributes'))
-                def_type = match.group('def_type')
-                name = match.group('name')
-                type_instance = match.group('type_instance')
-                proof = match.group('proof').strip()
-                
-                type_instance_defs = re.sub(r'^\s*|\s*$', '', re.sub(r'\s+', ' ', type_instance))
-                
-                # Clean up the statement
-                proof = re.sub(r'\s+', ' ', proof).strip()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if cache_dir is not None:
+                    cache_file = _cache_path(cache_dir, mm)
+                    cached = _load_cached(cache_file, lean_file)
+                    if cached is not None:
+                        return cached
                 
-                entry = {
-                    "attributes": attribs,
-                    "definition_type": def_type,
-                    "name": name,
-                    "instances": type_instance_defs,
-                    "proof": [proof] if proof else [],
-                    "file": str(lean_file),
-                    "line_number": ""
-                }
-                
-                results.append(entry)
-                
-        except Exception as e:
-            print(f"Error processing {lean_file}: {e}")
-            continue
+                # Remove comments for cleaner parsing
+                content = _strip_comments(mm)
+        
+        file_name = str(lean_file)
+        
+        # Find all matches
+        for match in _iter_declarations(content):
+            attribs, def_type, name, type_instance, proof = match.group(
+                'attributes', 'def_type', 'name', 'type_instance', 'proof'
+            )
+            
+            # Whitespace cleanup stays on the matched bytes, each in a single
+            # C-level pass (split() drops edge whitespace and collapses runs),
+            # and every field is decoded exactly once
+            attribs = attribs.rstrip().decode('utf-8')
+            type_instance_defs = b' '.join(type_instance.split()).decode('utf-8')
+            
+            # Clean up the statement
+            proof = b' '.join(proof.split()).decode('utf-8')
+            
+            # One tuple per entry, in _FIELDS order; no per-entry dict is
+            # built until output
+            results.append((
+                attribs,
+                def_type.decode('utf-8'),
+                name.decode('utf-8'),
+                type_instance_defs,
+                [proof] if proof else [],
+                file_name,
+                "",
+            ))
+        
+        # Only complete results are worth reusing
+        if cache_file is not None:
+            _store_cached(cache_file, results)
+            
+    except Exception as e:
+        print(f"Error processing {lean_file}: {e}")
+    
+    return results
+
+def _walk_lean_files(directory):
+    """Recursively yield the path of every .lean file under directory.
+    
+    Same files as Path.rglob("*.lean"), but each scandir entry already knows
+    its own type, so no extra stat() calls are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    with it:
+        for entry in it:
+            # Match rglob's paths, which carry no leading './'
+            path = entry.name if directory == os.curdir else entry.path
+            
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_lean_files(path)
+            elif entry.name.endswith('.lean') and entry.is_file():
+                yield path
+
+def _pool_workers():
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+def iter_lean_files(directory, cache_dir=None):
+    """Parse all .lean files recursively, yielding each file's entries (tuples in
+    _FIELDS order) as soon as it is done."""
+    
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    # Files are independent, so parse them across all usable cores; the pool
+    # consumes the walk lazily, so workers start before it has finished (and
+    # the file count needed to size chunks from it is never known up front)
+    lean_files = _walk_lean_files(os.fspath(Path(directory)))
+    parse_one = partial(_parse_one_file, cache_dir=cache_dir)
+    with _pool_context().Pool(_pool_workers()) as pool:
+        yield from pool.imap_unordered(parse_one, lean_files, chunksize=16)
+
+def parse_lean_files(directory, cache_dir=None):
+    """Parse all .lean files recursively and extract lemmas, theorems, and defs."""
+    
+    results = []
+    
+    for entries in iter_lean_files(directory, cache_dir):
+        results.extend(dict(zip(_FIELDS, entry)) for entry in entries)
     
     return results
 
+def _format_record(items, pad, step):
+    """Lay out (key, value) pairs exactly as json.dumps(dict(items),
+    indent=len(step), ensure_ascii=False) would, with pad in front of every
+    line after the first.
+    
+    String fields and lists of strings, which is all the parser produces, are
+    assembled around json's C string escaper; json's indenting encoder is
+    pure Python. Any other value is handed to json.dumps.
+    """
+    inner = pad + step
+    fields = []
+    
+    for key, value in items:
+        if isinstance(value, str):
+            text = encode_basestring(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            if value:
+                joined = ',\n'.join(inner + step + encode_basestring(item) for item in value)
+                text = f'[\n{joined}\n{inner}]'
+            else:
+                text = '[]'
+        else:
+            text = json.dumps(value, indent=len(step), ensure_ascii=False).replace('\n', '\n' + inner)
+        
+        fields.append(f'{inner}{encode_basestring(key)}: {text}')
+    
+    if not fields:
+        return '{}'
+    
+    body = ',\n'.join(fields)
+    return f'{{\n{body}\n{pad}}}'
+
+class _JsonArrayWriter:
+    """Write entry tuples one at a time, laid out exactly as json.dump() of the
+    equivalent dicts with indent=4 would."""
+    
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+    
+    def writerows(self, entries):
+        for entry in entries:
+            self.f.write(',\n    ' if self.count else '[\n    ')
+            self.f.write(_format_record(zip(_FIELDS, entry), '    ', '    '))
+            self.count += 1
+    
+    def close(self):
+        self.f.write('\n]' if self.count else '[]')
+
 def main():
     import sys
     
     all_params = len(sys.argv)
 
     if all_params < 2:
-        print("Usage: python3 lean_parser.py <directory> <output_file.json>")
+        print("Usage: python3 lean_parser.py <directory> <output_file.json> [cache_dir]")
         sys.exit(1)
     
     directory = sys.argv[1]
     
-    print(f"Parsing LEAN files in {directory}...")
-    definitions = parse_lean_files(directory)# Extract file extension and determine format
-
     # Get output filename from command line args or use default
     output_file = sys.argv[2] if len(sys.argv[2]) > 2 else "definitions.json"
+    
+    # Optional directory for reusing results of unchanged files across runs
+    cache_dir = sys.argv[3] if all_params > 3 else None
 
+    # Extract file extension and determine format
     file_name = os.path.splitext(output_file)[0].lower()
     file_ext = os.path.splitext(output_file)[1].lower()
 
     # Detect format based on file extension
-    if file_ext == '.csv': # CSV format
+    is_csv = file_ext == '.csv'
+    if is_csv: # CSV format
         output_file = f"{file_name}.csv"        
-        with open(output_file, "w", newline='', encoding="utf-8") as f:        
-            writer = csv.DictWriter(f, fieldnames=definitions[0].keys())
-            writer.writeheader()
-            writer.writerows(definitions)            
     else: # JSON format (default for unknown extensions or no extension)
         # Fallback: treat other extensions as JSON
         output_file = f"{file_name}.json"        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(definitions, f, indent=4, ensure_ascii=False)
     
-    print(f"\n{len(definitions)} definitions >> [{output_file}]")
+    print(f"Parsing LEAN files in {directory}...")
     
-    # Show summary
+    # Stream each file's entries to disk as soon as it is parsed; only the
+    # summary counts and the sample entry are kept in memory
+    total = 0
     summary = {}
-    for d in definitions:
-        dt = d['definition_type']
-        summary[dt] = summary.get(dt, 0) + 1
+    sample = None
     
+    with open(output_file, "w", newline='' if is_csv else None, encoding="utf-8") as f:
+        if is_csv:
+            # Entries already are rows in column order
+            writer = csv.writer(f)
+            writer.writerow(_FIELDS)
+        else:
+            writer = _JsonArrayWriter(f)
+        
+        for entries in iter_lean_files(directory, cache_dir):
+            writer.writerows(entries)
+            
+            for d in entries:
+                dt = d[_TYPE]
+                summary[dt] = summary.get(dt, 0) + 1
+            
+            total += len(entries)
+            if sample is None and entries:
+                sample = entries[0]
+        
+        if not is_csv:
+            writer.close()
+    
+    print(f"\n{total} definitions >> [{output_file}]")
+    
+    # Show summary
     print("\nSummary:")
     for dt, count in summary.items():
         print(f"  {dt}: {count}")
     
     # Show a sample entry
-    if definitions:
+    if sample:
         print("\nSample entry:")
-        print(json.dumps(definitions[0], indent=4, ensure_ascii=False))
+        print(json.dumps(dict(zip(_FIELDS, sample)), indent=4, ensure_ascii=False))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
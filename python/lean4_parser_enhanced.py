@@ -8,11 +8,114 @@ import os
 import re
 import json
 import argparse
+import multiprocessing as mp
+from array import array
+from bisect import bisect_left
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple, Set
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from json.encoder import encode_basestring
 
-@dataclass
+# Comment stripping: line and block comments in one left-to-right pass
+_COMMENT_RE = re.compile(r'--[^\n]*|/-.*?-/', re.DOTALL)
+
+# Pattern for local instances with better handling of complex expressions
+_LOCAL_INSTANCE_RE = re.compile(
+    r'\b(letI|haveI)\s*:\s*([^:=]+?)\s*:=\s*([^,\n]+(?:⟨[^⟩]*⟩)?)'
+)
+
+# Whitespace and comma cleanup for parameter lists
+_WS_RE = re.compile(r'\s+')
+# One pass over whitespace-collapsed text: leading and trailing commas are
+# dropped, interior comma runs keep a single comma (the captured group)
+_COMMA_CLEAN_RE = re.compile(r'^(?:, ?)+|(?: ?,)+$|(,)(?: ?,)+')
+
+# Balanced-expression scanning: the only characters that can change the
+# scan state (quotes, brackets and the end markers `:=`, `by`, `= `, `:`)
+_BRACE_PAIRS = {'(': ')', '[': ']', '{': '}', '⟨': '⟩'}
+_END_MARKERS = frozenset((':=', 'by', '= ', ':'))
+_BALANCE_EVENT_RE = re.compile(r'"|[()\[\]{}⟨⟩]|:=|:|by|= ')
+_NON_WS_RE = re.compile(r'\S')
+
+# Whatever comes first bounds a definition body: a `by`/`where` at a
+# line boundary, a blank line, or the start of the next declaration
+_BODY_END_RE = re.compile(
+    r'\nby |\nwhere |\n\n|by\n|where\n'
+    r'|\n\s*(?:@\[[^\]]*\]\s*)*(?:private\s+|protected\s+|noncomputable\s+)*(?:lemma|theorem|def)\s+'
+)
+
+def _newline_offsets(text: str) -> array:
+    """Return the offsets of every '\\n' in text, in ascending order."""
+    offsets = array('q')
+    pos = text.find('\n')
+    while pos != -1:
+        offsets.append(pos)
+        pos = text.find('\n', pos + 1)
+    return offsets
+
+def _walk_files(directory: str, suffixes: Tuple[str, ...]):
+    """Recursively yield the path of every file under directory ending in one of suffixes.
+    
+    Same files as Path.rglob, but each scandir entry already knows its own
+    type, so no extra stat() calls are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, suffixes)
+            elif entry.name.endswith(suffixes) and entry.is_file():
+                yield entry.path
+
+def _pool_workers() -> int:
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+def _format_record(record: Dict, pad: str, step: str) -> str:
+    """Lay out one flat record exactly as json.dumps(record, indent=len(step),
+    ensure_ascii=False) would, with pad in front of every line after the first.
+    
+    String fields and lists of strings, which is all the parser produces, are
+    assembled around json's C string escaper; json's indenting encoder is
+    pure Python. Any other value is handed to json.dumps.
+    """
+    inner = pad + step
+    fields = []
+    
+    for key, value in record.items():
+        if isinstance(value, str):
+            text = encode_basestring(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            if value:
+                items = ',\n'.join(inner + step + encode_basestring(item) for item in value)
+                text = f'[\n{items}\n{inner}]'
+            else:
+                text = '[]'
+        else:
+            text = json.dumps(value, indent=len(step), ensure_ascii=False).replace('\n', '\n' + inner)
+        
+        fields.append(f'{inner}{encode_basestring(key)}: {text}')
+    
+    if not fields:
+        return '{}'
+    
+    body = ',\n'.join(fields)
+    return f'{{\n{body}\n{pad}}}'
+
+@dataclass(slots=True)
 class LeanDefinition:
     """Represents a LEAN 4 definition (lemma, theorem, or def)."""
     title: str
@@ -22,84 +125,112 @@ class LeanDefinition:
     proof: List[str]
     file_path: str = ""
     line_number: int = 0
+    
+    def to_dict(self) -> Dict:
+        """Return the fields as a plain dict, in declaration order."""
+        # Explicit rather than dataclasses.asdict, which reflects over the
+        # fields and deep-copies every value for each instance
+        return {
+            'title': self.title,
+            'definition_type': self.definition_type,
+            'type_instance_definitions': self.type_instance_definitions,
+            'local_instances': self.local_instances,
+            'proof': self.proof,
+            'file_path': self.file_path,
+            'line_number': self.line_number,
+        }
 
 class EnhancedLean4Parser:
-    def __init__(self, verbose: bool = False):
+    # Enhanced pattern for declarations with better attribute handling
+    declaration_pattern = re.compile(
+        r'^(?P<indent>[ \t]*)'  # Capture indentation (never spans blank lines)
+        r'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Attributes
+        r'(?P<modifiers>(?:(?:private|protected|noncomputable|partial)\s+)*)'  # Modifiers
+        r'(?P<def_type>lemma|theorem|def)\s+'  # Declaration type
+        r'(?P<name>[^\s\[\(:{\n]+)'  # Name
+        r'(?P<rest>[^\n]*)',  # Rest of the line
+        re.MULTILINE
+    )
+    
+    # Pattern for extracting generics/type parameters
+    type_param_pattern = re.compile(r'\{[^}]+\}|\[[^\]]+\]|\([^)]+\)')
+    
+    def __init__(self, verbose: bool = False, track_lines: bool = True):
         self.verbose = verbose
-        
-        # Enhanced pattern for declarations with better attribute handling
-        self.declaration_pattern = re.compile(
-            r'^(?P<indent>\s*)'  # Capture indentation
-            r'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Attributes
-            r'(?P<modifiers>(?:(?:private|protected|noncomputable|partial)\s+)*)'  # Modifiers
-            r'(?P<def_type>lemma|theorem|def)\s+'  # Declaration type
-            r'(?P<name>[^\s\[\(:{\n]+)'  # Name
-            r'(?P<rest>.*?)$',  # Rest of the line
-            re.MULTILINE
-        )
-        
-        # Pattern for extracting generics/type parameters
-        self.type_param_pattern = re.compile(r'\{[^}]+\}|\[[^\]]+\]|\([^)]+\)')
+        # When False, every definition gets line_number 0 and no newline
+        # index is ever built
+        self.track_lines = track_lines
         
     def remove_comments(self, content: str) -> str:
         """Remove single-line and multi-line comments from LEAN code."""
-        # Remove single-line comments
-        content = re.sub(r'--[^\n]*', '', content)
-        # Remove multi-line comments
-        content = re.sub(r'/-.*?-/', '', content, flags=re.DOTALL)
-        return content
+        # A single scan sees whichever comment opens first, so `--` inside a
+        # block comment (or the `--` of a `/--` doc comment) can no longer
+        # swallow the block's closing `-/`
+        return _COMMENT_RE.sub('', content)
     
     def find_matching_brace(self, text: str, start: int, open_char: str, close_char: str) -> int:
         """Find the position of the matching closing brace/bracket/paren."""
+        # An opener is checked first, so a character that is both never closes
+        if open_char == close_char:
+            return -1
+        
+        # Hop between the next opener and the next closer with str.find
+        # rather than stepping through every character in between
         count = 1
-        i = start + 1
+        next_open = text.find(open_char, start + 1)
+        next_close = text.find(close_char, start + 1)
         
-        while i < len(text) and count > 0:
-            if text[i] == open_char:
+        while next_close != -1:
+            if next_open != -1 and next_open < next_close:
                 count += 1
-            elif text[i] == close_char:
+                next_open = text.find(open_char, next_open + 1)
+            else:
                 count -= 1
-            i += 1
+                if count == 0:
+                    return next_close + 1
+                next_close = text.find(close_char, next_close + 1)
         
-        return i if count == 0 else -1
+        return -1
     
     def extract_balanced_expression(self, content: str, start_pos: int) -> Tuple[str, int]:
         """Extract a balanced expression starting from start_pos."""
         # Skip whitespace
-        while start_pos < len(content) and content[start_pos].isspace():
-            start_pos += 1
-        
-        if start_pos >= len(content):
-            return "", start_pos
+        first = _NON_WS_RE.search(content, start_pos)
+        if first is None:
+            return "", len(content)
+        start_pos = first.start()
         
-        # Find the end of the declaration
-        brace_pairs = {'(': ')', '[': ']', '{': '}', '⟨': '⟩'}
+        # Find the end of the declaration, visiting only the characters that
+        # can change the scan state instead of every character
         stack = []
-        i = start_pos
+        i = len(content)
         in_string = False
         
-        while i < len(content):
-            char = content[i]
+        for event in _BALANCE_EVENT_RE.finditer(content, start_pos):
+            token = event.group()
+            pos = event.start()
             
             # Handle strings
-            if char == '"' and (i == 0 or content[i-1] != '\\'):
-                in_string = not in_string
+            if token == '"':
+                if pos == 0 or content[pos-1] != '\\':
+                    in_string = not in_string
+                continue
             
-            if not in_string:
-                # Check for declaration end markers
-                if not stack and content[i:i+2] in [':=', 'by', '= ']:
-                    break
-                if not stack and char == ':' and i+1 < len(content) and content[i+1] != '=':
-                    # This is the type separator
-                    break
-                
-                # Handle braces
-                if char in brace_pairs:
-                    stack.append(brace_pairs[char])
-                elif stack and char == stack[-1]:
-                    stack.pop()
+            if in_string:
+                continue
+            
+            # Check for declaration end markers (a lone ':' is the type
+            # separator, unless it is the very last character)
+            if not stack and (token != ':' or pos + 1 < len(content)) and token in _END_MARKERS:
+                i = pos
+                break
             
-            i += 1
+            # Handle braces
+            closer = _BRACE_PAIRS.get(token)
+            if closer is not None:
+                stack.append(closer)
+            elif stack and token == stack[-1]:
+                stack.pop()
         
         return content[start_pos:i].strip(), i
     
@@ -107,14 +238,11 @@ class EnhancedLean4Parser:
         """Extract letI and haveI declarations and return cleaned params."""
         local_instances = []
         
-        # Pattern for local instances with better handling of complex expressions
-        pattern = re.compile(
-            r'\b(letI|haveI)\s*:\s*([^:=]+?)\s*:=\s*([^,\n]+(?:⟨[^⟩]*⟩)?)'
-        )
+        # Keep the text between matches, dropping each matched span
+        kept = []
+        prev = 0
         
-        cleaned_params = params
-        
-        for match in pattern.finditer(params):
+        for match in _LOCAL_INSTANCE_RE.finditer(params):
             inst_type = match.group(1)
             inst_name = match.group(2).strip()
             inst_value = match.group(3).strip()
@@ -123,13 +251,16 @@ class EnhancedLean4Parser:
             local_instances.append(local_instance)
             
             # Remove from params
-            cleaned_params = cleaned_params.replace(match.group(0), '')
+            kept.append(params[prev:match.start()])
+            prev = match.end()
+        
+        kept.append(params[prev:])
+        cleaned_params = ''.join(kept)
         
         # Clean up extra whitespace and commas
-        cleaned_params = re.sub(r'\s+', ' ', cleaned_params)
-        cleaned_params = re.sub(r',\s*,', ',', cleaned_params)
-        cleaned_params = re.sub(r'^\s*,\s*', '', cleaned_params)
-        cleaned_params = re.sub(r'\s*,\s*$', '', cleaned_params)
+        cleaned_params = ' '.join(cleaned_params.split())
+        if ',' in cleaned_params:
+            cleaned_params = _COMMA_CLEAN_RE.sub(r'\1', cleaned_params)
         
         return local_instances, cleaned_params.strip()
     
@@ -150,28 +281,15 @@ class EnhancedLean4Parser:
         while pos < len(content) and content[pos] in ' \t':
             pos += 1
         
-        # Find the end of the statement (before 'by' or 'where')
-        end_markers = ['\nby ', '\nwhere ', '\n\n', 'by\n', 'where\n']
-        
-        # Also look for the next definition
-        next_def = re.search(
-            r'\n\s*(?:@\[[^\]]*\]\s*)*(?:private\s+|protected\s+|noncomputable\s+)*(lemma|theorem|def)\s+',
-            content[pos:]
-        )
-        
-        end_pos = len(content)
-        for marker in end_markers:
-            marker_pos = content.find(marker, pos)
-            if marker_pos != -1 and marker_pos < end_pos:
-                end_pos = marker_pos
-        
-        if next_def and pos + next_def.start() < end_pos:
-            end_pos = pos + next_def.start()
+        # Find the end of the statement (before 'by' or 'where', or the next
+        # definition) in one search that stops at the nearest terminator
+        end = _BODY_END_RE.search(content, pos)
+        end_pos = end.start() if end else len(content)
         
         statement = content[pos:end_pos].strip()
         
         # Clean up the statement
-        statement = re.sub(r'\s+', ' ', statement)
+        statement = _WS_RE.sub(' ', statement)
         
         return statement
     
@@ -190,17 +308,18 @@ class EnhancedLean4Parser:
         
         definitions = []
         
-        # Keep track of line numbers
-        lines = content.split('\n')
-        line_starts = [0]
-        for line in lines[:-1]:
-            line_starts.append(line_starts[-1] + len(line) + 1)
+        # Keep track of line numbers: a position's line is one more than
+        # the number of newlines before it. The newline index is only built
+        # on the first lookup, so files without definitions never pay for it
+        newlines = None
         
         def get_line_number(pos: int) -> int:
-            for i, start in enumerate(line_starts):
-                if pos < start:
-                    return i
-            return len(lines)
+            nonlocal newlines
+            if not self.track_lines:
+                return 0
+            if newlines is None:
+                newlines = _newline_offsets(content)
+            return bisect_left(newlines, pos) + 1
         
         # Find all declarations
         for match in self.declaration_pattern.finditer(content_no_comments):
@@ -212,13 +331,10 @@ class EnhancedLean4Parser:
                 decl_start = match.start()
                 line_num = get_line_number(decl_start)
                 
-                # Extract parameters and type
-                rest_of_line = match.group('rest')
-                
-                # Find the complete parameter list and type
-                full_content = content_no_comments[match.end():]
+                # Extract parameters and type: find the complete parameter
+                # list and type, scanning in place from the rest of the line
                 params_and_type, _ = self.extract_balanced_expression(
-                    rest_of_line + full_content, 0
+                    content_no_comments, match.start('rest')
                 )
                 
                 # Extract local instances
@@ -250,35 +366,39 @@ class EnhancedLean4Parser:
         """Recursively parse all LEAN 4 files in a directory."""
         all_definitions = []
         
-        # Find all relevant files
-        lean_files = []
-        for ext in extensions:
-            lean_files.extend(directory.rglob(f"*{ext}"))
-        
-        # Remove duplicates and sort
-        lean_files = sorted(set(lean_files))
+        # Find all relevant files in a single walk, whatever the number of
+        # extensions; sort so the output order is stable
+        lean_files = sorted(Path(p) for p in _walk_files(os.fspath(directory), tuple(extensions)))
         
         print(f"Found {len(lean_files)} LEAN files to parse...")
         
-        for i, filepath in enumerate(lean_files, 1):
-            if i % 10 == 0 or self.verbose:
-                print(f"Processing file {i}/{len(lean_files)}: {filepath.name}")
-            
-            definitions = self.parse_file(filepath)
-            all_definitions.extend(definitions)
+        # Files are independent, so parse them across all usable cores; imap
+        # keeps the results in sorted file order. About eight chunks per
+        # worker amortizes the per-task IPC while still balancing the load
+        workers = _pool_workers()
+        chunksize = max(1, len(lean_files) // (workers * 8))
+        with _pool_context().Pool(workers) as pool:
+            results = pool.imap(self.parse_file, lean_files, chunksize=chunksize)
+            for i, (filepath, definitions) in enumerate(zip(lean_files, results), 1):
+                if i % 10 == 0 or self.verbose:
+                    print(f"Processing file {i}/{len(lean_files)}: {filepath.name}")
+                
+                all_definitions.extend(definitions)
         
         return all_definitions
     
     def save_to_json(self, definitions: List[LeanDefinition], output_file: str, pretty: bool = True):
         """Save the extracted definitions to a JSON file."""
-        # Convert dataclasses to dicts
-        def_dicts = [asdict(d) for d in definitions]
-        
         with open(output_file, 'w', encoding='utf-8') as f:
             if pretty:
-                json.dump(def_dicts, f, indent=2, ensure_ascii=False)
+                # Same layout as json.dump(..., indent=2), one record at a time
+                for i, d in enumerate(definitions):
+                    f.write(',\n  ' if i else '[\n  ')
+                    f.write(_format_record(d.to_dict(), '  ', '  '))
+                f.write('\n]' if definitions else '[]')
             else:
-                json.dump(def_dicts, f, ensure_ascii=False)
+                # json.dumps takes json's C encoder; json.dump never does
+                f.write(json.dumps([d.to_dict() for d in definitions], ensure_ascii=False))
         
         print(f"\nExtracted {len(definitions)} definitions to {output_file}")
         
@@ -328,6 +448,11 @@ Examples:
         action="store_true",
         help="Enable verbose output"
     )
+    parser.add_argument(
+        "--no-line-numbers",
+        action="store_true",
+        help="Skip line number tracking (line_number is 0 for every definition)"
+    )
     parser.add_argument(
         "--pretty",
         action="store_true",
@@ -349,7 +474,7 @@ Examples:
         return 1
     
     # Create parser and process files
-    parser = EnhancedLean4Parser(verbose=args.verbose)
+    parser = EnhancedLean4Parser(verbose=args.verbose, track_lines=not args.no_line_numbers)
     definitions = parser.parse_directory(directory, set(args.extensions))
     
     # Filter by type if requested
@@ -3,58 +3,231 @@
 LEAN Parser Utilities - Tools for working with extracted LEAN definitions
 """
 
+import os
+import gc
 import json
+import pickle
 import argparse
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Set
 import csv
 import re
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
+from json.encoder import encode_basestring_ascii
+
+def _format_record(record: Dict, pad: str, step: str) -> str:
+    """Lay out one flat record exactly as json.dumps(record, indent=len(step),
+    ensure_ascii=True) would, with pad in front of every line after the first.
+    
+    String, integer and string-list fields, which is all the parsers produce,
+    are assembled around json's C string escaper; json's indenting encoder is
+    pure Python. Any other value is handed to json.dumps.
+    """
+    inner = pad + step
+    fields = []
+    
+    for key, value in record.items():
+        if isinstance(value, str):
+            text = encode_basestring_ascii(value)
+        elif type(value) is int:
+            text = int.__repr__(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            if value:
+                items = ',\n'.join(inner + step + encode_basestring_ascii(item) for item in value)
+                text = f'[\n{items}\n{inner}]'
+            else:
+                text = '[]'
+        else:
+            text = json.dumps(value, indent=len(step), ensure_ascii=True).replace('\n', '\n' + inner)
+        
+        fields.append(f'{inner}{encode_basestring_ascii(key)}: {text}')
+    
+    if not fields:
+        return '{}'
+    
+    body = ',\n'.join(fields)
+    return f'{{\n{body}\n{pad}}}'
+
+def _read_definitions(json_file: str) -> List[Dict]:
+    """Load the definitions in json_file, through a pickle sidecar next to it.
+    
+    The sidecar records the size and mtime of the JSON it was made from and
+    is rebuilt whenever they change; unpickling is many times faster than
+    parsing the JSON again on every run. Where the sidecar cannot be
+    written, the JSON is simply parsed every time.
+    """
+    stat = os.stat(json_file)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cache_file = Path(f"{json_file}.pickle")
+    
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_stamp, definitions = pickle.load(f)
+        if cached_stamp == stamp:
+            return definitions
+    except (OSError, EOFError, TypeError, ValueError, pickle.UnpicklingError):
+        # Missing or unreadable; rebuilt below
+        pass
+    
+    with open(json_file, 'r', encoding='utf-8') as f:
+        definitions = json.load(f)
+    
+    # A failure to write the sidecar (a read-only directory, say) only costs
+    # a JSON parse next run, so it is not reported
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((stamp, definitions), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Atomic, so a concurrent reader never sees a partial file
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+    
+    return definitions
+
+def _load_definitions(json_file: str) -> List[Dict]:
+    """_read_definitions with the cyclic garbage collector paused.
+    
+    Loading allocates hundreds of thousands of dicts and lists, none of them
+    garbage, and each allocation burst would otherwise trigger a collection
+    that walks all of them; that roughly doubles the load time.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _read_definitions(json_file)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str, flags: int) -> re.Pattern:
+    """Compile a search pattern, reusing it for repeated searches. re's own
+    cache is shared with every other module and evicts sooner."""
+    return re.compile(pattern, flags)
 
 class LeanDefinitionAnalyzer:
     def __init__(self, json_file: str):
-        with open(json_file, 'r', encoding='utf-8') as f:
-            self.definitions = json.load(f)
+        self.definitions = _load_definitions(json_file)
+        
+        # First definition with each title, built on first use by
+        # get_dependencies
+        self._by_title = None
+        
+        # Titles bucketed by length, built on first use by get_dependencies
+        self._title_buckets = None
+        
+        # Per-definition text searched by field='any', built on first use
+        self._any_text = None
+        
+        # Definition indices bucketed by type, built on first use by
+        # filter_by_type
+        self._type_buckets = None
     
     def search(self, pattern: str, field: str = 'title') -> List[Dict]:
         """Search definitions by regex pattern in specified field."""
-        regex = re.compile(pattern, re.IGNORECASE)
+        regex = _compile(pattern, re.IGNORECASE)
         results = []
         
-        for d in self.definitions:
-            if field == 'any':
-                # Search in all text fields
-                text = ' '.join([
-                    str(d.get('title', '')),
-                    str(d.get('type_instance_definitions', '')),
-                    ' '.join(d.get('local_instances', [])),
-                    ' '.join(d.get('proof', []))
-                ])
+        if field == 'any':
+            # Search in all text fields, joined once and reused by later searches
+            if self._any_text is None:
+                self._any_text = [
+                    ' '.join([
+                        str(d.get('title', '')),
+                        str(d.get('type_instance_definitions', '')),
+                        ' '.join(d.get('local_instances', [])),
+                        ' '.join(d.get('proof', []))
+                    ])
+                    for d in self.definitions
+                ]
+            
+            for text, d in zip(self._any_text, self.definitions):
                 if regex.search(text):
                     results.append(d)
-            elif field in d and regex.search(str(d[field])):
-                results.append(d)
+        else:
+            for d in self.definitions:
+                if field in d and regex.search(str(d[field])):
+                    results.append(d)
         
         return results
     
+    def _indices_by_type(self) -> Dict[str, List[int]]:
+        """Return the index of every definition, grouped by type in order."""
+        if self._type_buckets is None:
+            buckets = {}
+            for i, d in enumerate(self.definitions):
+                buckets.setdefault(d['definition_type'], []).append(i)
+            self._type_buckets = buckets
+        
+        return self._type_buckets
+    
     def filter_by_type(self, def_types: List[str]) -> List[Dict]:
         """Filter definitions by type (lemma, theorem, def)."""
-        return [d for d in self.definitions if d['definition_type'] in def_types]
+        buckets = self._indices_by_type()
+        selected = [buckets[t] for t in set(def_types) if t in buckets]
+        
+        # Each bucket is already in order, so one bucket needs no merging and
+        # several are merged by sorting their concatenated runs
+        if len(selected) == 1:
+            indices = selected[0]
+        else:
+            indices = sorted(chain.from_iterable(selected))
+        
+        definitions = self.definitions
+        return [definitions[i] for i in indices]
+    
+    def _definitions_by_title(self) -> Dict[str, Dict]:
+        """Return the first definition with each title. Records without a
+        title, such as lean4_parser.py's, are left out."""
+        if self._by_title is None:
+            by_title = {}
+            for d in self.definitions:
+                title = d.get('title')
+                if title is not None:
+                    by_title.setdefault(title, d)
+            self._by_title = by_title
+        
+        return self._by_title
+    
+    def _titles_by_length(self) -> Dict[int, Set[str]]:
+        """Return every definition title, grouped into sets by length."""
+        if self._title_buckets is None:
+            buckets = {}
+            for title in self._definitions_by_title():
+                buckets.setdefault(len(title), set()).add(title)
+            self._title_buckets = buckets
+        
+        return self._title_buckets
     
     def get_dependencies(self, definition_name: str) -> List[str]:
         """Extract potential dependencies from a definition's proof."""
+        d = self._definitions_by_title().get(definition_name)
+        if d is None:
+            return []
+        
+        # Look for references to other definitions in the proof
+        proof_text = ' '.join(d.get('proof', []))
+        
+        # Find potential theorem/lemma references. A title occurs in the proof
+        # exactly when it equals one of the proof's windows of the same length,
+        # so each window is looked up in the set of titles of that length: one
+        # pass per distinct title length instead of one substring search per
+        # definition
         deps = set()
+        n = len(proof_text)
+        for length, titles in self._titles_by_length().items():
+            if length <= n:
+                windows = [proof_text[i:i + length] for i in range(n - length + 1)]
+                deps.update(titles.intersection(windows))
         
-        for d in self.definitions:
-            if d['title'] == definition_name:
-                # Look for references to other definitions in the proof
-                proof_text = ' '.join(d.get('proof', []))
-                
-                # Find potential theorem/lemma references
-                for other in self.definitions:
-                    if other['title'] != definition_name and other['title'] in proof_text:
-                        deps.add(other['title'])
-                
-                break
+        deps.discard(definition_name)
         
         return sorted(deps)
     
@@ -64,47 +237,52 @@ class LeanDefinitionAnalyzer:
             writer = csv.writer(f)
             writer.writerow(['Title', 'Type', 'Parameters', 'Local Instances', 'Statement'])
             
-            for d in self.definitions:
-                writer.writerow([
+            # One writerows call; the csv module iterates the rows itself
+            writer.writerows(
+                (
                     d['title'],
                     d['definition_type'],
                     d['type_instance_definitions'],
                     ' | '.join(d['local_instances']),
                     ' '.join(d['proof'])
-                ])
+                )
+                for d in self.definitions
+            )
     
     def export_to_markdown(self, output_file: str):
         """Export definitions to Markdown format."""
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write("# LEAN 4 Definitions\n\n")
             
-            # Group by type
-            by_type = {}
-            for d in self.definitions:
-                dt = d['definition_type']
-                if dt not in by_type:
-                    by_type[dt] = []
-                by_type[dt].append(d)
+            # Group by type, in order of each type's first appearance. One
+            # stable sort by title up front leaves every group already sorted
+            by_type = defaultdict(list)
+            for d in sorted(self.definitions, key=itemgetter('title')):
+                by_type[d['definition_type']].append(d)
             
-            for def_type, defs in by_type.items():
-                f.write(f"## {def_type.capitalize()}s\n\n")
+            for def_type in dict.fromkeys(d['definition_type'] for d in self.definitions):
+                # Each section is collected into one string and written once,
+                # instead of a write call per line
+                chunks = [f"## {def_type.capitalize()}s\n\n"]
+                append = chunks.append
                 
-                for d in sorted(defs, key=lambda x: x['title']):
-                    f.write(f"### `{d['title']}`\n\n")
-                    
-                    if d['type_instance_definitions']:
-                        f.write(f"**Parameters:** `{d['type_instance_definitions']}`\n\n")
+                for d in by_type[def_type]:
+                    params = d['type_instance_definitions']
+                    local_instances = d['local_instances']
+                    proof = d['proof']
                     
-                    if d['local_instances']:
-                        f.write("**Local Instances:**\n")
-                        for inst in d['local_instances']:
-                            f.write(f"- `{inst}`\n")
-                        f.write("\n")
+                    # Optional blocks are empty strings when the field is,
+                    # so each entry is a single append
+                    params_block = f"**Parameters:** `{params}`\n\n" if params else ""
+                    instances_block = (
+                        "**Local Instances:**\n- `" + "`\n- `".join(local_instances) + "`\n\n"
+                        if local_instances else ""
+                    )
+                    statement_block = f"**Statement:** `{' '.join(proof)}`\n\n" if proof else ""
                     
-                    if d['proof']:
-                        f.write(f"**Statement:** `{' '.join(d['proof'])}`\n\n")
-                    
-                    f.write("---\n\n")
+                    append(f"### `{d['title']}`\n\n{params_block}{instances_block}{statement_block}---\n\n")
+                
+                f.write(''.join(chunks))
     
     def statistics(self) -> Dict:
         """Generate statistics about the definitions."""
@@ -116,30 +294,38 @@ class LeanDefinitionAnalyzer:
             'most_complex': None
         }
         
-        # Count by type
-        param_lengths = []
+        # Count by type, in a single pass with running totals
+        by_type = stats['by_type']
+        with_local_instances = 0
+        total_param_length = 0
         max_complexity = 0
         
         for d in self.definitions:
             # Type counts
             dt = d['definition_type']
-            stats['by_type'][dt] = stats['by_type'].get(dt, 0) + 1
+            by_type[dt] = by_type.get(dt, 0) + 1
             
             # Local instances
-            if d['local_instances']:
-                stats['with_local_instances'] += 1
+            local_instances = d['local_instances']
+            if local_instances:
+                with_local_instances += 1
             
             # Parameter length
             param_len = len(d['type_instance_definitions'])
-            param_lengths.append(param_len)
+            total_param_length += param_len
             
-            # Complexity (based on length and local instances)
-            complexity = param_len + len(' '.join(d['local_instances']))
+            # Complexity (based on length and local instances); joining the
+            # few short instances is cheaper than summing their lengths in
+            # Python
+            complexity = param_len
+            if local_instances:
+                complexity += len(' '.join(local_instances))
             if complexity > max_complexity:
                 max_complexity = complexity
                 stats['most_complex'] = d['title']
         
-        stats['avg_param_length'] = sum(param_lengths) / len(param_lengths) if param_lengths else 0
+        stats['with_local_instances'] = with_local_instances
+        stats['avg_param_length'] = total_param_length / stats['total'] if stats['total'] else 0
         
         return stats
 
@@ -200,7 +386,9 @@ def main():
         
         if args.output:
             with open(args.output, 'w') as f:
-                json.dump(results, f, indent=2)
+                # Same layout as json.dump(results, f, indent=2)
+                records = ',\n  '.join(_format_record(d, '  ', '  ') for d in results)
+                f.write(f'[\n  {records}\n]' if results else '[]')
             print(f"Saved to {args.output}")
     
     elif args.command == 'export':
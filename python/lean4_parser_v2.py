@@ -6,6 +6,10 @@ Simple LEAN 4 Parser - Extracts definitions in the exact requested format
 import os
 import re
 import json, csv
+import mmap
+import multiprocessing as mp
+from itertools import chain
+from json.encoder import encode_basestring
 from pathlib import Path
 
 def clean_up_params(m):
@@ -15,68 +19,251 @@ def clean_up_params(m):
     else:
         return ' '   # Other whitespace becomes single space
 
-def parse_lean_files(directory):
-    """Parse all .lean files recursively and extract lemmas, theorems, and defs."""
+# Declaration header (bytes, matched against the mapped file). Its type
+# instances only take flat groups, with no brackets nested inside them, so
+# the engine never backtracks into them; a signature with nested groups (or
+# none at all) leaves the optional colon and statement unmatched and is
+# finished by _scan_type_instances instead. So [Fintype ι] stays on the
+# header match, while [∀ i, T2Space (H i)], with its (H i) inside, falls
+# back to the scan
+_FLAT_GROUPS = rb'(?:\s*(?:\{[^{}\[\]()]*\}|\[[^{}\[\]()]*\]|\([^{}\[\]()]*\)))*'
+_STATEMENT = (
+    rb'\s*:(?!=)\s*'  # Colon separator, but not :=
+    rb'(?P<proof>[^\n]*?)(?=\s*(?::=\s+by\b|where\b)|$)'  # Type/statement, up to end of line
+)
+_HEADER_RE = re.compile(
+    rb'^(?P<indent>[ \t]*)'  # Capture indentation (never spans blank lines)
+    rb'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Optional attributes like @[simp]
+    rb'(?:private|protected|noncomputable|partial|unsafe|opaque\s+)*'  # Optional modifiers
+    rb'(?P<def_type>lemma|theorem|def|class|structure|inductive|instance|example|abbrev|axiom|constant|variable)\s+'  # Declaration type - EXTENDED
+    rb'(?P<name>[^\s\(\[:]+)'  # Name (stop at space, paren, bracket, colon)
+    rb'(?P<type_instance>' + _FLAT_GROUPS + rb')'  # Type instances, like [Fintype ι] (x : α)
+    rb'(?:' + _STATEMENT + rb')?',
+    re.MULTILINE
+)
+
+# Cheap prefilter for _HEADER_RE: a line whose first token can begin a
+# declaration. The leading literal newline lets the engine skip ahead with a
+# fast character search instead of trying the full pattern at every offset
+_DECL_START_RE = re.compile(
+    rb'\n[ \t]*(?=@\[|private|protected|noncomputable|partial|unsafe|opaque|'
+    rb'lemma|theorem|def|class|structure|inductive|instance|example|abbrev|axiom|constant|variable)'
+)
+
+# Signature pieces for _scan_type_instances: a run of flat groups, the
+# opening bracket of a nested one, any bracket inside it, and the statement
+_FLAT_GROUPS_RE = re.compile(_FLAT_GROUPS)
+_GROUP_OPEN_RE = re.compile(rb'\s*[{\[(]')
+_BRACKET_RE = re.compile(rb'([{\[(])|[}\])]')
+_STATEMENT_RE = re.compile(_STATEMENT, re.MULTILINE)
+
+def _scan_type_instances(content, pos):
+    """Return the end of the balanced {...}, [...] and (...) groups, with any
+    whitespace between them, that start at pos, or None if there are none.
+    """
+    start = pos
+    while True:
+        pos = _FLAT_GROUPS_RE.match(content, pos).end()
+        
+        opener = _GROUP_OPEN_RE.match(content, pos)
+        if opener is None:
+            break
+        
+        # A group with brackets inside: walk them to the one that closes it
+        pos = opener.end()
+        depth = 1
+        while depth:
+            bracket = _BRACKET_RE.search(content, pos)
+            if bracket is None:
+                return None  # Unterminated group
+            depth += 1 if bracket.lastindex else -1
+            pos = bracket.end()
     
-    results = []
+    return pos if pos > start else None
+
+def _iter_declarations(content):
+    """Yield (header match, name end, type instances, statement) for each
+    declaration in content."""
+    end = 0
+    
+    # The first line has no newline before it, so it is always a candidate
+    candidates = chain((0,), (m.start() + 1 for m in _DECL_START_RE.finditer(content)))
     
-    # Pattern to match lemma/theorem/def declarations
-    pattern = re.compile(
-        r'^(?P<indent>\s*)'  # Capture indentation
-        r'(?P<attributes>(?:@\[[^\]]*\]\s*)*)'  # Optional attributes like @[simp]
-        r'(?:private|protected|noncomputable|partial|unsafe|opaque\s+)*'  # Optional modifiers
-        r'(?P<def_type>lemma|theorem|def|class|structure|inductive|instance|example|abbrev|axiom|constant|variable)\s+'  # Declaration type - EXTENDED
-        r'(?P<name>[^\s\(\[:]+)'  # Name (stop at space, paren, bracket, colon)        
-        r'(?P<type_instance>(?:\s*(?:\{[^}]*\}|\[[^\]]*\]|\([^)]*\)))+)'  # Optional type instances, like [∀ i, T2Space (H i)]
-        r'\s*:\s*'  # Colon separator
-        r'(?P<proof>.*?)(?=\s*:=\s+by\b|\s*where\b|$)',  # Type/statement
-        re.MULTILINE | re.DOTALL
-    )
-    
-    # Extract local instances (letI and haveI)    
-    local_pattern = re.compile(r'^.*\b(letI|haveI)\b.*$', re.MULTILINE)
+    for start in candidates:
+        # Declarations never overlap
+        if start < end:
+            continue
+        
+        match = _HEADER_RE.match(content, start)
+        if match is None:
+            continue
+        
+        name_start, name_end = match.span('name')
+        groups_end = match.end('type_instance')
+        statement = match
+        
+        if groups_end == name_end or match.group('proof') is None:
+            # Nested groups, or no signature at all. The name only stops at
+            # whitespace, '(', '[' and ':', so it may also have run into a
+            # {...} group; if so, retry with the name cut at each '{'
+            statement = None
+            while name_end >= 0:
+                groups_end = _scan_type_instances(content, name_end)
+                if groups_end is not None:
+                    statement = _STATEMENT_RE.match(content, groups_end)
+                    if statement is not None:
+                        break
+                name_end = content.rfind(b'{', name_start + 1, name_end)
+            
+            if statement is None:
+                # Not a declaration
+                continue
+        
+        end = statement.end()
+        yield match, name_end, content[name_end:groups_end], statement.group('proof')
 
-    # Find all .lean files recursively
-    for lean_file in Path(directory).rglob("*.lean"):
-        try:
-            with open(lean_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+# Comment stripping
+_LINE_COMMENT_RE = re.compile(rb'--[^\n]*')
+_BLOCK_COMMENT_RE = re.compile(rb'/-.*?-/', re.DOTALL)
+
+def _parse_one_file(lean_file):
+    """Parse a single .lean file and extract its lemmas, theorems, and defs."""
+    
+    results = []
+    
+    try:
+        # mmap rejects empty files, which have nothing to parse anyway
+        if os.path.getsize(lean_file) == 0:
+            return results
+        
+        # Map the file and scan its bytes directly; only the captured
+        # groups are ever decoded
+        with open(lean_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # A file that is not UTF-8 is reported and skipped, as it was
+            # when the whole file was read as text
+            str(mm, 'utf-8')
             
             # Remove comments for cleaner parsing
-            content = re.sub(r'--[^\n]*', '', content)
-            content = re.sub(r'/-.*?-/', '', content, flags=re.DOTALL)
+            content = _LINE_COMMENT_RE.sub(b'', mm)
+        content = _BLOCK_COMMENT_RE.sub(b'', content)
+        
+        # Find all declarations. Whitespace is collapsed by splitting and
+        # rejoining, which drops leading and trailing runs in the same pass;
+        # bytes.split() and \s agree on what counts as whitespace
+        for match, name_end, type_instance, proof in _iter_declarations(content):
+            attribs = match.group('attributes').rstrip().decode('utf-8')
+            def_type = match.group('def_type').decode('utf-8')
+            name = content[match.start('name'):name_end].decode('utf-8')
             
-            # Find all matches
-            for match in pattern.finditer(content):
-                attribs = re.sub(r'\s+$', '', match.group('attributes'))
-                def_type = match.group('def_type')
-                name = match.group('name')
-                type_instance = match.group('type_instance')
-                proof = match.group('proof').strip()
-                
-                type_instance_defs = re.sub(r'^\s*|\s*$', '', re.sub(r'\s+', ' ', type_instance))
-                
-                # Clean up the statement
-                proof = re.sub(r'\s+', ' ', proof).strip()
-                
-                entry = {
-                    "attributes": attribs,
-                    "definition_type": def_type,
-                    "name": name,
-                    "instances": type_instance_defs,
-                    "proof": [proof] if proof else [],
-                    "file": str(lean_file),
-                    "line_number": ""
-                }
-                
-                results.append(entry)
-                
-        except Exception as e:
-            print(f"Error processing {lean_file}: {e}")
-            continue
+            type_instance_defs = b' '.join(type_instance.split()).decode('utf-8')
+            
+            # Clean up the statement
+            proof = b' '.join(proof.split()).decode('utf-8')
+            
+            entry = {
+                "attributes": attribs,
+                "definition_type": def_type,
+                "name": name,
+                "instances": type_instance_defs,
+                "proof": [proof] if proof else [],
+                "file": str(lean_file),
+                "line_number": ""
+            }
+            
+            results.append(entry)
+            
+    except Exception as e:
+        print(f"Error processing {lean_file}: {e}")
     
     return results
 
+def _walk_lean_files(directory):
+    """Recursively yield the path of every .lean file under directory.
+    
+    Same files, in the same order, as Path.rglob("*.lean"): each directory's
+    own files first, then its subdirectories. Each scandir entry already
+    knows its own type, so no extra stat() calls or Path objects are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    subdirs = []
+    with it:
+        for entry in it:
+            # Match rglob's paths, which carry no leading './'
+            path = entry.name if directory == os.curdir else entry.path
+            
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.name.endswith('.lean') and entry.is_file():
+                yield path
+    
+    for subdir in subdirs:
+        yield from _walk_lean_files(subdir)
+
+def _pool_workers():
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+def parse_lean_files(directory):
+    """Parse all .lean files recursively and extract lemmas, theorems, and defs."""
+    
+    results = []
+    
+    # Find all .lean files recursively
+    lean_files = _walk_lean_files(os.fspath(Path(directory)))
+    
+    # Files are independent, so parse them across all cores; imap keeps the
+    # results in file order
+    with _pool_context().Pool(_pool_workers()) as pool:
+        for entries in pool.imap(_parse_one_file, lean_files, chunksize=8):
+            results.extend(entries)
+    
+    return results
+
+def _format_record(record, pad, step):
+    """Lay out one flat record exactly as json.dumps(record, indent=len(step),
+    ensure_ascii=False) would, with pad in front of every line after the first.
+    
+    String fields and lists of strings, which is all the parser produces, are
+    assembled around json's C string escaper; json's indenting encoder is
+    pure Python. Any other value is handed to json.dumps.
+    """
+    inner = pad + step
+    fields = []
+    
+    for key, value in record.items():
+        if isinstance(value, str):
+            text = encode_basestring(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            if value:
+                items = ',\n'.join(inner + step + encode_basestring(item) for item in value)
+                text = f'[\n{items}\n{inner}]'
+            else:
+                text = '[]'
+        else:
+            text = json.dumps(value, indent=len(step), ensure_ascii=False).replace('\n', '\n' + inner)
+        
+        fields.append(f'{inner}{encode_basestring(key)}: {text}')
+    
+    if not fields:
+        return '{}'
+    
+    body = ',\n'.join(fields)
+    return f'{{\n{body}\n{pad}}}'
+
 def main():
     import sys
     
@@ -112,7 +299,10 @@ def main():
         # Fallback: treat other extensions as JSON
         output_file = f"{file_name}.json"        
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(definitions, f, indent=4, ensure_ascii=False)
+            # Same layout as json.dump(..., indent=4), without json's
+            # pure-Python indenting encoder
+            records = ',\n    '.join(_format_record(d, '    ', '    ') for d in definitions)
+            f.write(f'[\n    {records}\n]' if definitions else '[]')
     
     print(f"\n{len(definitions)} definitions >> [{output_file}]")
     
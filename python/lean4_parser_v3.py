@@ -5,41 +5,105 @@ Simple LEAN 4 Parser - Simpler version - captures everything up to [:=, where, b
 
 import os
 import re
-import json,csv
+import csv
+import mmap
+import multiprocessing as mp
+from itertools import chain
+from json.encoder import encode_basestring
 from pathlib import Path
 
-#bugggy
-def parse_lean_files(directory):
-    """Parse all .lean files and extract definitions up to := or where."""
+# Pattern: captures everything from doc comment/attributes/definition keyword 
+# up to (but not including) := or where
+_DEF_RE = re.compile(
+    rb'^.+?'  # Everything else (non-greedy)
+    rb'(?=\s*(?::=|where\b|by\b))',  # Stop before :=, where, or by
+    re.MULTILINE | re.DOTALL
+)
+
+def _parse_one_file(lean_file):
+    """Parse a single .lean file and extract its definitions up to := or where."""
     
     results = []
     
-    # Pattern: captures everything from doc comment/attributes/definition keyword 
-    # up to (but not including) := or where
-    pattern = re.compile(
-        r'^.+?'  # Everything else (non-greedy)
-        r'(?=\s*(?::=|where\b|by\b))',  # Stop before :=, where, or by
-        re.MULTILINE | re.DOTALL
-    )
-    
-    # Find all .lean files
-    for lean_file in Path(directory).rglob("*.lean"):
-        try:
-            with open(lean_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+    try:
+        # mmap rejects empty files, which have nothing to parse anyway
+        if os.path.getsize(lean_file) == 0:
+            return results
+        
+        # Scan the mapped file's bytes directly; only matches are decoded
+        with open(lean_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # A file that is not UTF-8 is reported and skipped, as it was
+            # when the whole file was read as text
+            str(mm, 'utf-8')
             
-            # Find all matches
-            for match in pattern.finditer(content):
-                definition = match.group(1).strip()
+            # Find all matches, skipping whitespace-only ones before they
+            # are decoded. Excluding those in the pattern instead would not
+            # skip them: the search would stretch each one into a longer,
+            # different match from the same line
+            for match in _DEF_RE.finditer(mm):
+                definition = match.group(0).strip()
                 if definition:
-                    results.append(definition)
-                    
-        except Exception as e:
-            print(f"Error processing {lean_file}: {e}")
-            continue
+                    results.append(definition.decode('utf-8'))
+                
+    except Exception as e:
+        print(f"Error processing {lean_file}: {e}")
     
     return results
 
+def _walk_lean_files(directory):
+    """Recursively yield the path of every .lean file under directory.
+    
+    Same files, in the same order, as Path.rglob("*.lean"): each directory's
+    own files first, then its subdirectories. Each scandir entry already
+    knows its own type, so no extra stat() calls or Path objects are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    subdirs = []
+    with it:
+        for entry in it:
+            # Match rglob's paths, which carry no leading './'
+            path = entry.name if directory == os.curdir else entry.path
+            
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.name.endswith('.lean') and entry.is_file():
+                yield path
+    
+    for subdir in subdirs:
+        yield from _walk_lean_files(subdir)
+
+def _pool_workers():
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+#bugggy
+def parse_lean_files(directory):
+    """Parse all .lean files and extract definitions up to := or where."""
+    
+    # Find all .lean files
+    lean_files = _walk_lean_files(os.fspath(Path(directory)))
+    
+    # Files are independent, so parse them across all cores; imap keeps the
+    # results in file order. The same header often recurs across files, so
+    # only the first copy of each definition is kept
+    with _pool_context().Pool(_pool_workers()) as pool:
+        definitions = pool.imap(_parse_one_file, lean_files, chunksize=8)
+        return list(dict.fromkeys(chain.from_iterable(definitions)))
+
 def main():
     import sys
     
@@ -75,7 +139,10 @@ def main():
         # Fallback: treat other extensions as JSON
         output_file = f"{file_name}.json"        
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(definitions, f, indent=4, ensure_ascii=False)
+            # Same layout as json.dump(..., indent=4) of the list of strings,
+            # escaped by json's C string encoder in one write
+            items = ',\n    '.join(map(encode_basestring, definitions))
+            f.write(f'[\n    {items}\n]' if definitions else '[]')
     
     print(f"\n{len(definitions)} definitions >> [{output_file}]")
     
@@ -4,14 +4,18 @@ LEAN 4 State Machine Parser to properly handle nested delimiters and LEAN's comp
 """
 
 import os
+import re
 import json
 import csv
+import multiprocessing as mp
+from array import array
+from json.encoder import encode_basestring
 from pathlib import Path
-from enum import Enum, auto
+from enum import IntEnum, auto
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Tuple
 
-class TokenType(Enum):
+class TokenType(IntEnum):
     # Keywords
     LEMMA = auto()
     THEOREM = auto()
@@ -54,14 +58,7 @@ class TokenType(Enum):
     OTHER = auto()
     EOF = auto()
 
-@dataclass
-class Token:
-    type: TokenType
-    value: str
-    line: int
-    column: int
-
-@dataclass
+@dataclass(slots=True)
 class Definition:
     doc_comment: str = ""
     attributes: List[str] = field(default_factory=list)
@@ -73,6 +70,148 @@ class Definition:
     file: str = ""
     line: int = 0
 
+# The next character that can end a string (its quote, or a backslash
+# escaping the character after it), or an attribute's bracket
+_STRING_STOP_RES = {
+    '"': re.compile(r'["\\]'),
+    "'": re.compile(r"['\\]"),
+}
+_BRACKET_RE = re.compile(r'[\[\]]')
+
+# Master pattern for the lexer: leading spaces and tabs, then one named
+# group for the kind of token that starts there, in order of precedence.
+# Block comments, attributes and strings only have their opening matched;
+# their end scanners find the rest. [^\W\d] is every word character except
+# decimal digits, which also lets through a few numeric characters the
+# lexer turns back into OTHER
+_TOKEN_RE = re.compile(
+    r"[ \t]*(?:"
+    r"(?P<comment>--[^\n]*)"
+    r"|(?P<block>/-)"
+    r"|(?P<assign>:=)"
+    r"|(?P<attribute>@\[)"
+    r"|(?P<single>[()\[\]{}:\n])"
+    r"|(?P<string>[\"'])"
+    r"|(?P<identifier>[^\W\d][\w'ₐₑₕᵢⱼₖₗₘₙₒₚᵣₛₜᵤᵥₓ₀₁₂₃₄₅₆₇₈₉]*)"
+    r"|(?P<other>.)"
+    r")?",
+    re.DOTALL
+)
+
+# Token types for the master pattern's groups that are complete tokens
+_RUN_TOKENS = {
+    'comment': TokenType.LINE_COMMENT,
+    'assign': TokenType.ASSIGN,
+    'other': TokenType.OTHER,
+}
+
+_KEYWORDS = {
+    'lemma': TokenType.LEMMA,
+    'theorem': TokenType.THEOREM,
+    'def': TokenType.DEF,
+    'class': TokenType.CLASS,
+    'structure': TokenType.STRUCTURE,
+    'inductive': TokenType.INDUCTIVE,
+    'variable': TokenType.VARIABLE,
+    'where': TokenType.WHERE,
+    'by': TokenType.BY,
+    'private': TokenType.PRIVATE,
+    'protected': TokenType.PROTECTED,
+    'noncomputable': TokenType.NONCOMPUTABLE,
+}
+
+# Keywords bucketed by length. Most identifiers are not keywords, and most
+# of those have a length no keyword has, so one lookup by length rules them
+# out without hashing (or, in tokenize, even slicing) their text
+_KEYWORDS_BY_LENGTH = {}
+for _keyword, _token_type in _KEYWORDS.items():
+    _KEYWORDS_BY_LENGTH.setdefault(len(_keyword), {})[_keyword] = _token_type
+del _keyword, _token_type
+
+# The one text each keyword and := token can have. Tokens of these types
+# carry the shared string from here instead of a fresh slice of the source
+# (one-character tokens need no table: CPython already shares those strings)
+_FIXED_TEXT = {token_type: keyword for keyword, token_type in _KEYWORDS.items()}
+_FIXED_TEXT[TokenType.ASSIGN] = ':='
+
+# Characters that are always a token of their own
+_SINGLE_CHAR_TOKENS = {
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    ':': TokenType.COLON,
+    '\n': TokenType.NEWLINE,
+}
+
+def _block_comment_end(content: str, start: int) -> int:
+    """Return the end of the (possibly nested) block comment at start."""
+    pos = start + 2  # skip /-
+    
+    # A doc comment's extra '-' can never close it
+    if content.startswith('-', pos):
+        pos += 1
+    
+    # Hop between comment markers with str.find; a '/-' that opens before
+    # the next '-/' nests one level deeper
+    depth = 1
+    while depth > 0:
+        close = content.find('-/', pos)
+        if close < 0:
+            return len(content)  # Unterminated: the rest of the file
+        
+        opener = content.find('/-', pos, close + 1)
+        if opener >= 0:
+            pos = opener + 2
+            depth += 1
+        else:
+            pos = close + 2
+            depth -= 1
+    
+    return pos
+
+def _string_end(content: str, start: int) -> int:
+    """Return the end of the string literal whose opening quote is at start."""
+    quote_stop = _STRING_STOP_RES[content[start]]
+    pos = start + 1
+    
+    # Jump to the closing quote, skipping escaped characters
+    while True:
+        stop = quote_stop.search(content, pos)
+        if stop is None:
+            return len(content)  # Unterminated: the rest of the file
+        
+        pos = stop.end()
+        if stop.group() != '\\':
+            return pos
+        if pos < len(content):
+            pos += 1  # skip escaped character
+
+def _attribute_end(content: str, start: int) -> int:
+    """Return the end of the @[...] attribute at start."""
+    pos = start + 2  # skip @[
+    
+    # Jump from bracket to bracket until the one closing the attribute
+    bracket_depth = 1
+    while bracket_depth > 0:
+        bracket = _BRACKET_RE.search(content, pos)
+        if bracket is None:
+            return len(content)  # Unterminated: the rest of the file
+        
+        pos = bracket.end()
+        bracket_depth += 1 if bracket.group() == '[' else -1
+    
+    return pos
+
+# Tokens that can span lines, and the scanner that finds each one's end
+_LONG_TOKEN_ENDS = {
+    'block': _block_comment_end,
+    'attribute': _attribute_end,
+    'string': _string_end,
+}
+
 class Lexer:
     def __init__(self, content: str):
         self.content = content
@@ -80,357 +219,423 @@ class Lexer:
         self.line = 1
         self.column = 1
         
-    def peek(self, offset: int = 0) -> Optional[str]:
-        pos = self.position + offset
-        if pos < len(self.content):
-            return self.content[pos]
-        return None
-    
-    def advance(self) -> Optional[str]:
-        if self.position >= len(self.content):
-            return None
-        char = self.content[self.position]
-        self.position += 1
-        if char == '\n':
-            self.line += 1
-            self.column = 1
-        else:
-            self.column += 1
-        return char
-    
-    def read_while(self, predicate) -> str:
-        start = self.position
-        while self.position < len(self.content) and predicate(self.content[self.position]):
-            self.advance()
-        return self.content[start:self.position]
-    
-    def skip_whitespace(self):
-        self.read_while(lambda c: c in ' \t')
-    
-    def read_line_comment(self) -> Token:
-        start_line, start_col = self.line, self.column
-        self.advance()  # skip first -
-        self.advance()  # skip second -
-        value = self.read_while(lambda c: c != '\n')
-        return Token(TokenType.LINE_COMMENT, '--' + value, start_line, start_col)
-    
-    def read_block_comment(self) -> Token:
-        start_line, start_col = self.line, self.column
-        self.advance()  # skip /
-        self.advance()  # skip -
-        
-        # Check if it's a doc comment
-        is_doc = self.peek() == '-'
-        if is_doc:
-            self.advance()
-        
-        comment_text = '/-' + ('-' if is_doc else '')
-        depth = 1
-        
-        while depth > 0 and self.position < len(self.content):
-            if self.peek() == '-' and self.peek(1) == '/':
-                self.advance()
-                self.advance()
-                comment_text += '-/'
-                depth -= 1
-            elif self.peek() == '/' and self.peek(1) == '-':
-                self.advance()
-                self.advance()
-                comment_text += '/-'
-                depth += 1
-            else:
-                comment_text = f"{comment_text}{self.advance()}"
-        
-        return Token(
-            TokenType.DOC_COMMENT if is_doc else TokenType.BLOCK_COMMENT,
-            comment_text,
-            start_line,
-            start_col
-        )
-    
-    def read_string(self) -> Token:
-        start_line, start_col = self.line, self.column
-        quote_char = self.advance()  # skip opening quote
-        value = quote_char if quote_char else ''
-        
-        while self.position < len(self.content):
-            char = self.advance()
-            value = f"{value}{char}"
-            if char == quote_char:
+    def tokenize(self) -> Tuple[array, array, array, array]:
+        """Lex the rest of the content into parallel arrays, one entry per
+        token: its type, start and end offsets, and line. The last token is
+        EOF, with an empty span where the content ends.
+        
+        No object or text is built for any token; a token's text is
+        content[start:end] when the parser needs it. Types are stored as
+        their TokenType codes, which compare equal to the members.
+        """
+        content = self.content
+        types = array('b')
+        starts = array('l')
+        ends = array('l')
+        lines = array('l')
+        
+        # Everything the loop touches per token is bound to a local once
+        match_token = _TOKEN_RE.match
+        add_type, add_start, add_end, add_line = types.append, starts.append, ends.append, lines.append
+        keywords_by_length = _KEYWORDS_BY_LENGTH
+        single_char_tokens = _SINGLE_CHAR_TOKENS
+        run_tokens = _RUN_TOKENS
+        long_token_ends = _LONG_TOKEN_ENDS
+        IDENTIFIER = TokenType.IDENTIFIER
+        NEWLINE = TokenType.NEWLINE
+        
+        pos = self.position
+        line = self.line
+        
+        while True:
+            match = match_token(content, pos)
+            kind = match.lastgroup
+            if kind is None:
                 break
-            elif char == '\\' and self.position < len(self.content):
-                value = f"{value}{self.advance()}" # skip escaped character
-        
-        return Token(TokenType.STRING, value, start_line, start_col)
-    
-    def read_identifier(self) -> Token:
-        start_line, start_col = self.line, self.column
-        value = self.read_while(lambda c: c.isalnum() or c in '_\'ₐₑₕᵢⱼₖₗₘₙₒₚᵣₛₜᵤᵥₓ₀₁₂₃₄₅₆₇₈₉')
-        
-        # Check for keywords
-        keyword_map = {
-            'lemma': TokenType.LEMMA,
-            'theorem': TokenType.THEOREM,
-            'def': TokenType.DEF,
-            'class': TokenType.CLASS,
-            'structure': TokenType.STRUCTURE,
-            'inductive': TokenType.INDUCTIVE,
-            'variable': TokenType.VARIABLE,
-            'where': TokenType.WHERE,
-            'by': TokenType.BY,
-            'private': TokenType.PRIVATE,
-            'protected': TokenType.PROTECTED,
-            'noncomputable': TokenType.NONCOMPUTABLE,
-        }
-        
-        token_type = keyword_map.get(value, TokenType.IDENTIFIER)
-        return Token(token_type, value, start_line, start_col)
-    
-    def read_attribute(self) -> Token:
-        start_line, start_col = self.line, self.column
-        self.advance()  # skip @
-        self.advance()  # skip [
-        
-        bracket_depth = 1
-        value = '@['
-        
-        while bracket_depth > 0 and self.position < len(self.content):
-            char = self.peek()
-            if char == '[':
-                bracket_depth += 1
-            elif char == ']':
-                bracket_depth -= 1
-            value = f"{value}{self.advance()}"
-        
-        return Token(TokenType.ATTRIBUTE, value, start_line, start_col)
-    
-    def next_token(self) -> Token:
-        self.skip_whitespace()
-        
-        if self.position >= len(self.content):
-            return Token(TokenType.EOF, '', self.line, self.column)
-        
-        _c = self.peek()
-        char = _c if _c else ''
-        
-        # Handle two-character tokens
-        if char == '-' and self.peek(1) == '-':
-            return self.read_line_comment()
-        elif char == '/' and self.peek(1) == '-':
-            return self.read_block_comment()
-        elif char == ':' and self.peek(1) == '=':
-            line, col = self.line, self.column
-            self.advance()
-            self.advance()
-            return Token(TokenType.ASSIGN, ':=', line, col)
-        elif char == '@' and self.peek(1) == '[':
-            return self.read_attribute()
-        
-        # Handle single-character tokens
-        line, col = self.line, self.column
-        
-        if char == '(':
-            self.advance()
-            return Token(TokenType.LPAREN, '(', line, col)
-        elif char == ')':
-            self.advance()
-            return Token(TokenType.RPAREN, ')', line, col)
-        elif char == '[':
-            self.advance()
-            return Token(TokenType.LBRACKET, '[', line, col)
-        elif char == ']':
-            self.advance()
-            return Token(TokenType.RBRACKET, ']', line, col)
-        elif char == '{':
-            self.advance()
-            return Token(TokenType.LBRACE, '{', line, col)
-        elif char == '}':
-            self.advance()
-            return Token(TokenType.RBRACE, '}', line, col)
-        elif char == ':':
-            self.advance()
-            return Token(TokenType.COLON, ':', line, col)
-        elif char == '\n':
-            self.advance()
-            return Token(TokenType.NEWLINE, '\n', line, col)
-        elif char in list('"\''):
-            return self.read_string()
-        elif char and char.isalpha() or char in list('_αβγδεζηθικλμνξοπρστυφχψω'):
-            return self.read_identifier()
-        else:
-            self.advance()
-            return Token(TokenType.OTHER, char, line, col)
+            
+            start, end = match.span(kind)
+            
+            if kind == 'identifier':
+                start_char = content[start]
+                if start_char.isalpha() or start_char == '_':
+                    keywords = keywords_by_length.get(end - start)
+                    if keywords:
+                        token_type = keywords.get(content[start:end], IDENTIFIER)
+                    else:
+                        token_type = IDENTIFIER
+                else:
+                    # A numeric character that cannot start an identifier
+                    token_type = TokenType.OTHER
+                    end = start + 1
+            elif kind == 'single':
+                token_type = single_char_tokens[content[start]]
+            elif kind in run_tokens:
+                token_type = run_tokens[kind]
+            else:
+                end = long_token_ends[kind](content, start)
+                if kind == 'block':
+                    is_doc = content.startswith('/--', start)
+                    token_type = TokenType.DOC_COMMENT if is_doc else TokenType.BLOCK_COMMENT
+                elif kind == 'attribute':
+                    token_type = TokenType.ATTRIBUTE
+                else:
+                    token_type = TokenType.STRING
+            
+            add_type(token_type)
+            add_start(start)
+            add_end(end)
+            add_line(line)
+            
+            if token_type == NEWLINE:
+                line += 1
+            elif kind in long_token_ends:
+                line += content.count('\n', start, end)
+            
+            pos = end
+        
+        # What is left is trailing whitespace
+        pos = match.end()
+        types.append(TokenType.EOF)
+        starts.append(pos)
+        ends.append(pos)
+        lines.append(line)
+        
+        self.position = pos
+        self.line = line
+        self.column = pos - content.rfind('\n', 0, pos)
+        
+        return types, starts, ends, lines
+
+# Token classes the parser tests membership in
+_LAYOUT_TYPES = frozenset({TokenType.WHITESPACE, TokenType.NEWLINE})
+_MODIFIER_TYPES = frozenset({TokenType.PRIVATE, TokenType.PROTECTED, TokenType.NONCOMPUTABLE})
+_DEF_TYPES = frozenset({
+    TokenType.LEMMA, TokenType.THEOREM, TokenType.DEF,
+    TokenType.CLASS, TokenType.STRUCTURE, TokenType.INDUCTIVE,
+    TokenType.VARIABLE,
+})
+
+# Tokens that can begin a definition: its doc comment, an attribute, a
+# modifier or the declaration keyword itself
+_DEFINITION_START_TYPES = _DEF_TYPES | _MODIFIER_TYPES | {TokenType.DOC_COMMENT, TokenType.ATTRIBUTE}
+
+# Finds the next definition start in the token types' raw bytes, so the
+# tokens in between are skipped by the regex engine rather than one at a time
+_DEFINITION_START_RE = re.compile(b'[' + re.escape(bytes(sorted(_DEFINITION_START_TYPES))) + b']')
+
+# Signature scanning: the top-level tokens that end a signature, and the
+# bracket tokens whose nesting it tracks
+_SIGNATURE_ENDS = frozenset({TokenType.ASSIGN, TokenType.WHERE, TokenType.BY})
+_OPENING_BRACKETS = frozenset({TokenType.LPAREN, TokenType.LBRACKET, TokenType.LBRACE})
+_CLOSING_BRACKETS = frozenset({TokenType.RPAREN, TokenType.RBRACKET, TokenType.RBRACE})
+
+# Openers of the tokens that can contain spaces or tabs: comments, strings
+# and attributes
+_SPACED_TOKEN_RE = re.compile(r'--|/-|@\[|["\']')
 
 class Parser:
     def __init__(self, content: str, filename: str = ""):
-        self.lexer = Lexer(content)
+        self.content = content
         self.filename = filename
-        self.current_token = None
-        self.peek_token = None
-        self.advance()
-        self.advance()
         
-    def advance(self):
-        self.current_token = self.peek_token
-        self.peek_token = self.lexer.next_token()
+        # The whole file is lexed up front into parallel token arrays;
+        # position is the index of the current token
+        self.types, self.starts, self.ends, self.lines = Lexer(content).tokenize()
+        self.position = 0
+    
+    def token_value(self, index: int) -> str:
+        """Text of the token at index, sliced from the content on demand."""
+        return self.content[self.starts[index]:self.ends[index]]
         
     def parse(self) -> List[Definition]:
         definitions = []
         
-        while self.current_token and self.current_token.type != TokenType.EOF:
-            # Skip whitespace and regular comments
-            if self.current_token.type in [TokenType.WHITESPACE, TokenType.NEWLINE, 
-                                          TokenType.LINE_COMMENT, TokenType.BLOCK_COMMENT]:
-                self.advance()
-                continue
+        # Jump straight from one definition start to the next: whitespace,
+        # regular comments and anything else that cannot start a definition
+        # are skipped by one search over the type codes. EOF is never a start
+        find_start = _DEFINITION_START_RE.search
+        codes = self.types.tobytes()
+        
+        while True:
+            start = find_start(codes, self.position)
+            if start is None:
+                break
             
-            # Check for definition start
-            if self.current_token.type == TokenType.DOC_COMMENT or \
-               self.current_token.type == TokenType.ATTRIBUTE or \
-               self.current_token.type in [TokenType.PRIVATE, TokenType.PROTECTED, TokenType.NONCOMPUTABLE] or \
-               self.current_token.type in [TokenType.LEMMA, TokenType.THEOREM, TokenType.DEF, 
-                                         TokenType.CLASS, TokenType.STRUCTURE, TokenType.INDUCTIVE, 
-                                         TokenType.VARIABLE]:
-                defn = self.parse_definition()
-                if defn:
-                    definitions.append(defn)
-            else:
-                self.advance()
+            self.position = start.start()
+            defn = self.parse_definition()
+            if defn:
+                definitions.append(defn)
         
+        # Stop on the EOF token, as the token walk did
+        self.position = len(codes) - 1
         return definitions
     
     def parse_definition(self) -> Optional[Definition]:
         defn = Definition(file=self.filename)
+        types = self.types
+        lines = self.lines
+        index = self.position
         
         # Parse doc comment if present
-        if self.current_token and self.current_token.type == TokenType.DOC_COMMENT:
-            defn.doc_comment = self.current_token.value
-            defn.line = self.current_token.line
-            self.advance()
+        if types[index] == TokenType.DOC_COMMENT:
+            defn.doc_comment = self.token_value(index)
+            defn.line = lines[index]
+            index += 1
             # Skip whitespace after doc comment
-            while self.current_token.type in [TokenType.WHITESPACE, TokenType.NEWLINE]:
-                self.advance()
+            while types[index] in _LAYOUT_TYPES:
+                index += 1
         
         # Parse attributes
-        while self.current_token and self.current_token.type == TokenType.ATTRIBUTE:
-            defn.attributes.append(self.current_token.value)
+        while types[index] == TokenType.ATTRIBUTE:
+            defn.attributes.append(self.token_value(index))
             if defn.line == 0:
-                defn.line = self.current_token.line
-            self.advance()
+                defn.line = lines[index]
+            index += 1
             # Skip whitespace after attributes
-            while self.current_token.type in [TokenType.WHITESPACE, TokenType.NEWLINE]:
-                self.advance()
+            while types[index] in _LAYOUT_TYPES:
+                index += 1
         
         # Parse modifiers
-        while self.current_token and self.current_token.type in [TokenType.PRIVATE, TokenType.PROTECTED, TokenType.NONCOMPUTABLE]:
-            defn.modifiers.append(self.current_token.value)
+        while types[index] in _MODIFIER_TYPES:
+            defn.modifiers.append(_FIXED_TEXT[types[index]])
             if defn.line == 0:
-                defn.line = self.current_token.line
-            self.advance()
+                defn.line = lines[index]
+            index += 1
             # Skip whitespace after modifiers
-            while self.current_token.type == TokenType.WHITESPACE:
-                self.advance()
+            while types[index] == TokenType.WHITESPACE:
+                index += 1
         
         # Parse definition type
-        if self.current_token and self.current_token.type not in [TokenType.LEMMA, TokenType.THEOREM, TokenType.DEF, 
-                                          TokenType.CLASS, TokenType.STRUCTURE, TokenType.INDUCTIVE, 
-                                          TokenType.VARIABLE]:
+        if types[index] not in _DEF_TYPES:
+            self.position = index
             return None
         
-        defn.def_type = self.current_token.value if self.current_token else '' 
+        defn.def_type = _FIXED_TEXT[types[index]]
 
         if defn.line == 0:
-            defn.line = self.current_token.line if self.current_token and self.current_token.line else 0
-        self.advance()
+            defn.line = lines[index]
+        index += 1
         
         # Skip whitespace
-        while self.current_token and self.current_token.type == TokenType.WHITESPACE:
-            self.advance()
+        while types[index] == TokenType.WHITESPACE:
+            index += 1
         
         # Parse name
-        if self.current_token and self.current_token.type != TokenType.IDENTIFIER:
+        if types[index] != TokenType.IDENTIFIER:
+            self.position = index
             return None
         
-        defn.name = self.current_token.value if self.current_token and self.current_token.value else '' 
-        self.advance()
+        defn.name = self.token_value(index)
+        self.position = index + 1
         
         # Parse signature (everything until := or where or by)
-        signature_tokens = []
-        bracket_stack = []
+        defn.signature = self.scan_signature(defn.def_type == 'variable').strip()
         
-        while self.current_token and self.current_token.type != TokenType.EOF:
-            # Check for end of signature
-            if not bracket_stack:  # Only at top level
-                if self.current_token.type == TokenType.ASSIGN:
-                    break
-                if self.current_token.type == TokenType.WHERE:
-                    break
-                if self.current_token.type == TokenType.BY:
+        return defn
+    
+    def scan_signature(self, is_variable: bool) -> str:
+        """Consume a signature's tokens, up to a top-level :=, where or by (or,
+        for a variable, the end of the line), and return their joined text.
+        
+        The walk only reads token types; the text of the tokens it passes
+        over is taken from the content once, at the end.
+        """
+        types = self.types
+        first = index = self.position
+        signature_ends = _SIGNATURE_ENDS
+        opening_brackets, closing_brackets = _OPENING_BRACKETS, _CLOSING_BRACKETS
+        EOF, NEWLINE = TokenType.EOF, TokenType.NEWLINE
+        
+        # One depth for all kinds of bracket: the code the parser accepts
+        # nests them properly, so each closer matches the innermost opener.
+        # A closer with nothing open is ignored
+        depth = 0
+        
+        while types[index] != EOF:
+            token_type = types[index]
+            
+            # Check for end of signature, only at top level
+            if not depth:
+                if token_type in signature_ends:
                     break
                 # For variables, newline can end the definition
-                if defn.def_type == 'variable' and self.current_token.type == TokenType.NEWLINE:
+                if is_variable and token_type == NEWLINE:
                     break
             
             # Track brackets
-            if self.current_token.type in [TokenType.LPAREN, TokenType.LBRACKET, TokenType.LBRACE]:
-                bracket_stack.append(self.current_token.type)
-            elif self.current_token.type == TokenType.RPAREN and bracket_stack and bracket_stack[-1] == TokenType.LPAREN:
-                bracket_stack.pop()
-            elif self.current_token.type == TokenType.RBRACKET and bracket_stack and bracket_stack[-1] == TokenType.LBRACKET:
-                bracket_stack.pop()
-            elif self.current_token.type == TokenType.RBRACE and bracket_stack and bracket_stack[-1] == TokenType.LBRACE:
-                bracket_stack.pop()
+            if token_type in opening_brackets:
+                depth += 1
+            elif depth and token_type in closing_brackets:
+                depth -= 1
             
-            signature_tokens.append(self.current_token.value)
-            self.advance()
+            index += 1
         
-        defn.signature = ''.join(signature_tokens).strip()
+        self.position = index
+        if index == first:
+            return ''
         
-        return defn
+        # Only spaces and tabs ever lie between tokens, so unless a token in
+        # the span can hold them too, dropping them all from the signature's
+        # source text joins its tokens without slicing each one out
+        content, starts, ends = self.content, self.starts, self.ends
+        text = content[starts[first]:ends[index - 1]]
+        if not _SPACED_TOKEN_RE.search(text):
+            return text.replace(' ', '').replace('\t', '')
+        
+        return ''.join([content[starts[i]:ends[i]] for i in range(first, index)])
 
-def parse_lean_files(directory: str) -> List[Dict]:
-    """Parse all .lean files recursively."""
+# Output fields, in order: JSON keys and CSV columns
+_FIELDS = ("full_definition", "doc_comment", "attributes", "modifiers",
+           "definition_type", "name", "signature", "file", "line")
+
+def _parse_one_file(lean_file) -> List[Dict]:
+    """Parse a single .lean file and build its definition entries."""
     results = []
     
-    for lean_file in Path(directory).rglob("*.lean"):
-        try:
-            with open(lean_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+    try:
+        # One read of the raw bytes and one decode, instead of the text
+        # layer's incremental decoding and newline translation
+        with open(lean_file, 'rb') as f:
+            content = f.read().decode('utf-8')
+        
+        # Universal newlines, as text mode gave, only when the file needs them
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        
+        parser = Parser(content, str(lean_file))
+        definitions = parser.parse()
+        
+        for defn in definitions:
+            # Build the full definition text, formatted in one go instead of
+            # grown piece by piece
+            doc = f"{defn.doc_comment}\n" if defn.doc_comment else ""
+            attributes = f"{' '.join(defn.attributes)} " if defn.attributes else ""
+            modifiers = f"{' '.join(defn.modifiers)} " if defn.modifiers else ""
+            full_text = f"{doc}{attributes}{modifiers}{defn.def_type} {defn.name}{defn.signature}"
             
-            parser = Parser(content, str(lean_file))
-            definitions = parser.parse()
+            results.append({
+                "full_definition": full_text.strip(),
+                "doc_comment": defn.doc_comment,
+                "attributes": defn.attributes,
+                "modifiers": defn.modifiers,
+                "definition_type": defn.def_type,
+                "name": defn.name,
+                "signature": defn.signature,
+                "file": defn.file,
+                "line": defn.line
+            })
+    
+    except Exception as e:
+        print(f"Error processing {lean_file}: {e}")
+    
+    return results
+
+def _walk_lean_files(directory):
+    """Recursively yield the path of every .lean file under directory.
+    
+    Same files, in the same order, as Path.rglob("*.lean"): each directory's
+    own files first, then its subdirectories. Each scandir entry already
+    knows its own type, so no extra stat() calls or Path objects are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    subdirs = []
+    with it:
+        for entry in it:
+            # Match rglob's paths, which carry no leading './'
+            path = entry.name if directory == os.curdir else entry.path
             
-            for defn in definitions:
-                # Build the full definition text
-                full_text = ""
-                if defn.doc_comment:
-                    full_text += defn.doc_comment + "\n"
-                if defn.attributes:
-                    full_text += ' '.join(defn.attributes) + ' '
-                if defn.modifiers:
-                    full_text += ' '.join(defn.modifiers) + ' '
-                full_text += defn.def_type + ' ' + defn.name
-                if defn.signature:
-                    full_text += defn.signature
-                
-                results.append({
-                    "full_definition": full_text.strip(),
-                    "doc_comment": defn.doc_comment,
-                    "attributes": defn.attributes,
-                    "modifiers": defn.modifiers,
-                    "definition_type": defn.def_type,
-                    "name": defn.name,
-                    "signature": defn.signature,
-                    "file": defn.file,
-                    "line": defn.line
-                })
-                
-        except Exception as e:
-            print(f"Error processing {lean_file}: {e}")
-            continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.name.endswith('.lean') and entry.is_file():
+                yield path
+    
+    for subdir in subdirs:
+        yield from _walk_lean_files(subdir)
+
+def _pool_workers() -> int:
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+def iter_lean_files(directory: str):
+    """Parse all .lean files recursively, yielding each file's definitions
+    as soon as it is done."""
+    
+    # Files are independent, so parse them across all cores; imap keeps the
+    # results in file order and consumes the walk lazily
+    lean_files = _walk_lean_files(os.fspath(Path(directory)))
+    with _pool_context().Pool(_pool_workers()) as pool:
+        yield from pool.imap(_parse_one_file, lean_files, chunksize=8)
+
+def parse_lean_files(directory: str) -> List[Dict]:
+    """Parse all .lean files recursively."""
+    results = []
+    
+    for definitions in iter_lean_files(directory):
+        results.extend(definitions)
     
     return results
 
+def _format_record(record: Dict, pad: str, step: str) -> str:
+    """Lay out one flat record exactly as json.dumps(record, indent=len(step),
+    ensure_ascii=False) would, with pad in front of every line after the first.
+    
+    String fields and lists of strings are assembled around json's C string
+    escaper; json's indenting encoder is pure Python. Any other value (the
+    line number) is handed to json.dumps.
+    """
+    inner = pad + step
+    fields = []
+    
+    for key, value in record.items():
+        if isinstance(value, str):
+            text = encode_basestring(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            if value:
+                items = ',\n'.join(inner + step + encode_basestring(item) for item in value)
+                text = f'[\n{items}\n{inner}]'
+            else:
+                text = '[]'
+        else:
+            text = json.dumps(value, indent=len(step), ensure_ascii=False).replace('\n', '\n' + inner)
+        
+        fields.append(f'{inner}{encode_basestring(key)}: {text}')
+    
+    if not fields:
+        return '{}'
+    
+    body = ',\n'.join(fields)
+    return f'{{\n{body}\n{pad}}}'
+
+class _JsonArrayWriter:
+    """Write records one at a time, laid out exactly as json.dump() of the
+    whole list with indent=4 would."""
+    
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+    
+    def writerows(self, records):
+        for record in records:
+            self.f.write(',\n    ' if self.count else '[\n    ')
+            self.f.write(_format_record(record, '    ', '    '))
+            self.count += 1
+    
+    def close(self):
+        self.f.write('\n]' if self.count else '[]')
+
 def main():
     import sys
     
@@ -442,48 +647,76 @@ def main():
     
     directory = sys.argv[1]
     
-    print(f"Parsing LEAN files in {directory}...")
-    definitions = parse_lean_files(directory)# Extract file extension and determine format
-
-    if not definitions:
-        print("Error: No parsed LEAN files matched the required search and catalog criteria. Exiting")
-        sys.exit(1)
-
     # Get output filename from command line args or use default
     output_file = sys.argv[2] if len(sys.argv[2]) > 2 else "definitions.json"
 
+    # Extract file extension and determine format
     file_name = os.path.splitext(output_file)[0].lower()
     file_ext = os.path.splitext(output_file)[1].lower()
 
     # Detect format based on file extension
-    if file_ext == '.csv': # CSV format
+    is_csv = file_ext == '.csv'
+    if is_csv: # CSV format
         output_file = f"{file_name}.csv"        
-        with open(output_file, "w", newline='', encoding="utf-8") as f:        
-            writer = csv.DictWriter(f, fieldnames=definitions[0].keys())
-            writer.writeheader()
-            writer.writerows(definitions)            
     else: # JSON format (default for unknown extensions or no extension)
         # Fallback: treat other extensions as JSON
         output_file = f"{file_name}.json"        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(definitions, f, indent=4, ensure_ascii=False)
     
-    print(f"\n{len(definitions)} definitions >> [{output_file}]")
+    print(f"Parsing LEAN files in {directory}...")
     
-    # Show summary
+    # Stream each file's definitions to disk as soon as it is parsed; only
+    # the summary counts and the sample entry are kept in memory. They go to
+    # a temp file next to the target, which only replaces it once the run
+    # has produced something, so an empty, failed or interrupted run leaves
+    # any earlier output in place
+    total = 0
     summary = {}
-    for d in definitions:
-        dt = d['definition_type']
-        summary[dt] = summary.get(dt, 0) + 1
+    sample = None
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
     
+    try:
+        with open(tmp_file, "w", newline='' if is_csv else None, encoding="utf-8") as f:
+            if is_csv:
+                writer = csv.DictWriter(f, fieldnames=_FIELDS)
+                writer.writeheader()
+            else:
+                writer = _JsonArrayWriter(f)
+            
+            for definitions in iter_lean_files(directory):
+                writer.writerows(definitions)
+                
+                for d in definitions:
+                    dt = d['definition_type']
+                    summary[dt] = summary.get(dt, 0) + 1
+                
+                total += len(definitions)
+                if sample is None and definitions:
+                    sample = definitions[0]
+            
+            if not is_csv:
+                writer.close()
+        
+        if total:
+            os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    if not total:
+        print("Error: No parsed LEAN files matched the required search and catalog criteria. Exiting")
+        sys.exit(1)
+    
+    print(f"\n{total} definitions >> [{output_file}]")
+    
+    # Show summary
     print("\nSummary:")
     for dt, count in summary.items():
         print(f"  {dt}: {count}")
     
     # Show a sample entry
-    if definitions:
+    if sample:
         print("\nSample entry:")
-        print(json.dumps(definitions[0], indent=4, ensure_ascii=False))
+        print(json.dumps(sample, indent=4, ensure_ascii=False))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -16,28 +16,38 @@ def clean_up_params(m):
     else:
         return ' '   # Other whitespace becomes single space
 
+# Line patterns, compiled once rather than on every call. A line names the
+# definition if it has any character a name can contain
+_NAME_RE = re.compile(r'[^\s\(\[:]+', re.MULTILINE | re.DOTALL) # Name (stop at space, paren, bracket, colon) 
+
+# A line holds the declaration if a declaration keyword and whitespace
+# appear on it (modifiers are optional, so they never decide a match).
+# Searched over the file's lines joined with '\n', which no line contains,
+# so the whitespace must not be that newline
+_DEF_TYPE_RE = re.compile(
+    r'(?P<def_type>lemma|theorem|def|class|structure|inductive|variable)[^\S\n]'  # Declaration type
+)
+
 def parse_defs(curr_line: dict) -> dict:
 
     i = curr_line['i']
     I = curr_line['I']
+    content = curr_line['content']
 
-    pattern = re.compile(r'[^\s\(\[:]+', re.MULTILINE | re.DOTALL) # Name (stop at space, paren, bracket, colon) 
-    if i<I and not re.search(pattern, curr_line['content'][i]):
+    if i<I and not _NAME_RE.search(content[i]):
         i += 1
 
     if i < I:
         curr_line['entry']['line_number'] = i + 1  # Line numbers are 1-based
-        curr_line['entry']['name'] = curr_line['content'][i]
+        curr_line['entry']['name'] = content[i]
         i += 1
     
-    pattern = re.compile(r'(?P<proof>.*?)(?=\s*:=\s+by\b|\s*where\b|$)', re.MULTILINE | re.DOTALL)
-    while i<I and not re.search(pattern, curr_line['content'][i]):
-        curr_line['entry']['instances'] = f"{curr_line['entry']['instances']} {curr_line['content'][i]}"
-        i += 1
-
+    # The proof is the next line. (A scan for it with the pattern
+    # .*?(?=\s*:=\s+by\b|\s*where\b|$) never moved: that pattern also
+    # matches the empty string, so it found a match on every line.)
     curr_line['i'] = i
     if i<I:
-        curr_line['entry']['proof'] = curr_line['content'][i]
+        curr_line['entry']['proof'] = content[i]
 
     return curr_line
 
@@ -55,27 +65,33 @@ def parse_attr(curr_line: dict) -> dict:
 
     i = curr_line['i']
     I = curr_line['I']
+    content = curr_line['content']
 
-    while i<I and not re.search(r'(?:@\[[^\]]*\]\s*)*', curr_line['content'][i]):
-        i += 1
-        
+    # The attributes start on the current line. (A scan for it with the
+    # pattern (?:@\[[^\]]*\]\s*)* never moved: that pattern also matches the
+    # empty string, so it found a match on every line.)
     if i < I:
-        curr_line['entry']['attributes'] = curr_line['content'][i]
+        curr_line['entry']['attributes'] = content[i]
         i += 1
 
-    pattern = re.compile(
-        r'(?:private\s+|protected\s+|noncomputable\s+)*'  # Optional modifiers
-        r'(?P<def_type>lemma|theorem|def|class|structure|inductive|variable)\s+',  # Declaration type
-        re.DOTALL
-    )
-
-    while i<I and not re.search(pattern, curr_line['content'][i]):
-        curr_line['entry']['attributes'] = f"{curr_line['entry']['attributes']} {curr_line['content'][i]}"
-        i += 1
+    # Every line up to the declaration keyword belongs to the attributes.
+    # One search over the remaining lines, joined into one text, finds the
+    # declaration line instead of a regex call per line
+    attributes = [curr_line['entry']['attributes']]
+    if i < I:
+        text = '\n'.join(content)
+        offset = sum(map(len, content[:i])) + i  # Start of line i
+        
+        match = _DEF_TYPE_RE.search(text, offset)
+        end = i + text.count('\n', offset, match.start()) if match else I
+        
+        attributes.extend(content[i:end])
+        i = end
+    curr_line['entry']['attributes'] = ' '.join(attributes)
 
     curr_line['i'] = i        
     if i < I:
-        curr_line['entry']['definition_type'] = curr_line['content'][i]
+        curr_line['entry']['definition_type'] = content[i]
 
     curr_line = parse_defs(curr_line)
 
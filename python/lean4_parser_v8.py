@@ -1,169 +1,597 @@
 import os
 import re
+import mmap
+import multiprocessing as mp
 import pickle, json, csv
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate, chain, compress, count, islice, pairwise, repeat
+from operator import and_, itemgetter, lshift, or_, rshift
+from json.encoder import encode_basestring
 from typing import List, Dict, Set, Tuple, Optional
 from pathlib import Path
 
+# Word-boundary tokenization that skips comments in the same scan, compiled
+# once. Only tokens are captured; a line or block comment matches the bare
+# alternatives and comes back as '', and the lookahead keeps a comment's
+# opening '-' or '/' from being taken as punctuation. An unterminated '/-'
+# is not a comment, so its characters stay tokens. A line comment also stops
+# at a lone '\r', which text mode would have read as a newline. A scan only
+# reaches a word character at the start of a word, and the greedy run always
+# ends at a boundary, so the pattern needs no \b assertions
+_TOKEN_RE = re.compile(r'(\w+|(?!--|/-.*?-/)[^\w\s])|--[^\r\n]*|/-.*?-/', re.DOTALL)
+_PLAIN_TOKEN_RE = re.compile(r'(\w+|(?!--)[^\w\s])|--[^\r\n]*')
+
+def _tokenize(content: str) -> List[str]:
+    """Split content on whitespace and punctuation, keeping the punctuation
+    and dropping the comments.
+    
+    A '/-' with no '-/' after it sends the block-comment search to the end
+    of the text every time, which is quadratic in a file full of them. None
+    can close past the last '-/', so the scan with block comments stops at
+    the end of that line and the rest is scanned without them.
+    """
+    last_close = content.rfind('-/')
+    cut = content.find('\n', last_close) if last_close >= 0 else 0
+    if cut < 0:
+        cut = len(content)
+    
+    tokens = _TOKEN_RE.findall(content, 0, cut)
+    tokens += _PLAIN_TOKEN_RE.findall(content, cut)
+    return list(filter(None, tokens))
+
+def _walk_lean_files(directory):
+    """Recursively yield the path of every .lean file under directory.
+    
+    Same files, in the same order, as Path.rglob("*.lean"): each directory's
+    own files first, then its subdirectories. Each scandir entry already
+    knows its own type, so no extra stat() calls or Path objects are made.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError:
+        # Missing or unreadable directories are skipped, as rglob does
+        return
+    
+    subdirs = []
+    with it:
+        for entry in it:
+            # Match rglob's paths, which carry no leading './'
+            path = entry.name if directory == os.curdir else entry.path
+            
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.name.endswith('.lean') and entry.is_file():
+                yield path
+    
+    for subdir in subdirs:
+        yield from _walk_lean_files(subdir)
+
+def _pool_workers() -> int:
+    """Number of CPUs this process may actually run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+def _pool_context():
+    """Prefer fork where available: workers inherit the compiled patterns copy-on-write."""
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+
+_DECL_KEYWORDS = frozenset({'lemma', 'theorem', 'def', 'axiom', 'example', 'instance', 'structure', 'class'})
+
+# The declarations tally_lean4_lemmas.py counts
+_TALLY_TYPES = frozenset({'lemma', 'theorem', 'def'})
+
+def _find_declarations(tokens: List[str]) -> List[Tuple[str, int, str]]:
+    """Find the lemma/theorem/def declarations in a token sequence, as
+    (name, token index, declaration type)."""
+    declarations = []
+    num_tokens = len(tokens)
+    
+    # The keyword positions, picked out at C level
+    for i in compress(count(), map(_DECL_KEYWORDS.__contains__, tokens)):
+        # Found a declaration
+        decl_type = tokens[i]
+        
+        # Next non-punctuation token should be the name. This takes a step
+        # or two per declaration, and str.isalnum checks every character,
+        # so a name like mul_comm is skipped; a first-character lookup
+        # table would be no faster here and would accept it
+        j = i + 1
+        while j < num_tokens and not tokens[j].isalnum():
+            j += 1
+        
+        if j < num_tokens:
+            declarations.append((tokens[j], i, decl_type))
+    
+    return declarations
+
+def _token_graph(tokens: List[str]) -> Tuple[List[str], Tuple[int, ...], Tuple[int, ...]]:
+    """Reduce a token sequence to its distinct words, in order of first
+    appearance, and its distinct edges between consecutive tokens, in order
+    of first appearance, as parallel source and target indices into those
+    words.
+    
+    Merging these adds exactly what walking the whole sequence would.
+    """
+    if len(tokens) < 2:
+        return [], (), ()  # No edges, so no words are registered either
+    
+    # The id sequence is streamed straight into the edge dedup, so no
+    # per-token list of ids is ever built
+    local_ids = {word: i for i, word in enumerate(dict.fromkeys(tokens))}
+    edges = dict.fromkeys(pairwise(map(local_ids.__getitem__, tokens)))
+    sources, targets = zip(*edges)
+    return list(local_ids), sources, targets
+
+# Pending edges that trigger a compaction of the word graph while parsing
+_COMPACT_EVERY = 1 << 22
+
+def _gather(values: List[int], indices: Tuple[int, ...]) -> Tuple[int, ...]:
+    """values[i] for each i in indices, looked up in one C-level call"""
+    if len(indices) == 1:
+        return (values[indices[0]],)  # itemgetter would return it bare
+    return itemgetter(*indices)(values)
+
+def _parse_one_file(filepath: str):
+    """Tokenize one file and reduce it to (token count, declarations, words,
+    edge sources, edge targets) for Lean4Parser to merge, or return the
+    error that stopped it."""
+    try:
+        tokens = Lean4Parser.tokenize_file(filepath)
+    except Exception as e:
+        return e
+    
+    return (len(tokens), _find_declarations(tokens)) + _token_graph(tokens)
+
+def _parse_declarations_of_file(filepath: str):
+    """Tokenize one file and return its declarations alone, with no word
+    graph, or the error that stopped it."""
+    try:
+        tokens = Lean4Parser.tokenize_file(filepath)
+    except Exception as e:
+        return e
+    
+    return _find_declarations(tokens)
+
+def _iter_json(value, pad: str, step: str):
+    """Yield the text of json.dumps(value, indent=len(step),
+    ensure_ascii=False) in pieces, with pad in front of every line after
+    the first, so it can be written out as it is produced.
+    
+    Dicts, and lists of anything else, including the word graph's rows, are
+    laid out item by item; lists of plain strings and ints and int arrays,
+    which hold almost all of the data, are joined in one go around json's C
+    string escaper. Anything else is handed to json.dumps.
+    """
+    if isinstance(value, dict):
+        if not value:
+            yield '{}'
+            return
+        
+        inner = pad + step
+        separator = '{\n' + inner
+        for key, item in value.items():
+            yield f'{separator}{encode_basestring(key)}: '
+            yield from _iter_json(item, inner, step)
+            separator = ',\n' + inner
+        yield '\n' + pad + '}'
+    
+    elif isinstance(value, (list, tuple, _GraphRows)):
+        if not value:
+            yield '[]'
+            return
+        
+        inner = pad + step
+        if all(type(item) is str or type(item) is int for item in value):
+            items = (',\n' + inner).join([
+                encode_basestring(item) if type(item) is str else int.__repr__(item)
+                for item in value
+            ])
+            yield f'[\n{inner}{items}\n{pad}]'
+            return
+        
+        separator = '[\n' + inner
+        for item in value:
+            yield separator
+            yield from _iter_json(item, inner, step)
+            separator = ',\n' + inner
+        yield '\n' + pad + ']'
+    
+    elif isinstance(value, array):
+        if not value:
+            yield '[]'
+            return
+        
+        # Machine ints, written straight from the buffer
+        inner = pad + step
+        items = (',\n' + inner).join(map(str, value))
+        yield f'[\n{inner}{items}\n{pad}]'
+    
+    elif isinstance(value, str):
+        yield encode_basestring(value)
+    
+    elif type(value) is int:
+        yield int.__repr__(value)
+    
+    else:
+        yield json.dumps(value)
+
+class _GraphRows:
+    """The non-empty rows of a CSR word graph as (word id, array of target
+    ids) pairs, sliced out only as they are read, so the graph can be
+    written out without a copy of it."""
+    
+    def __init__(self, indptr: array, indices: array):
+        self.indptr = indptr
+        self.indices = indices
+    
+    def __bool__(self) -> bool:
+        return bool(self.indices)
+    
+    def __iter__(self):
+        indptr, indices = self.indptr, self.indices
+        for w in range(len(indptr) - 1):
+            start, end = indptr[w], indptr[w + 1]
+            if start != end:
+                yield w, indices[start:end]
+
 class Lean4Parser:
     """Simple LEAN 4 parser (JSON) using word-boundary tokenization"""
     
     def __init__(self):
-        self.adjacency_list = defaultdict(set)
+        # Word graph in compressed sparse row form: the ids of the words
+        # that follow word w are indices[indptr[w]:indptr[w + 1]], sorted.
+        # Edges added since the last compaction wait in the pending buffers
+        self.indptr = array('I', [0])
+        self.indices = array('I')
+        self._pending_src = array('I')
+        self._pending_dst = array('I')
+        # Each distinct word once, at the index of its id
         self.word_to_id = {}
-        self.id_to_word = {}
-        self.current_id = 0
+        self.id_to_word = []
         self.lemmas = {}  # name -> (file, token_indices)
+        self._clear_name_index()
         
     def get_word_id(self, word: str) -> int:
         """Get or create ID for a word"""
-        if word not in self.word_to_id:
-            self.word_to_id[word] = self.current_id
-            self.id_to_word[self.current_id] = word
-            self.current_id += 1
-        return self.word_to_id[word]
+        word_id = self.word_to_id.get(word)
+        if word_id is None:
+            word_id = self.word_to_id[word] = len(self.id_to_word)
+            self.id_to_word.append(word)
+        return word_id
     
-    def tokenize_file(self, filepath: str) -> List[str]:
+    @staticmethod
+    def tokenize_file(filepath: str) -> List[str]:
         """Simple word-boundary tokenization"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # mmap rejects empty files, which have no tokens anyway
+        if os.path.getsize(filepath) == 0:
+            return []
         
-        # Remove comments
-        content = re.sub(r'--[^\n]*', '', content)
-        content = re.sub(r'/-.*?-/', '', content, flags=re.DOTALL)
+        # Decode straight from the mapped file, with no bytes copy in between
+        with open(filepath, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            content = str(mm, 'utf-8')
         
         # Split on whitespace and punctuation, keeping the punctuation
-        tokens = re.findall(r'\b\w+\b|[^\w\s]', content)
+        tokens = _tokenize(content)
         
         return tokens
     
     def extract_declarations(self, tokens: List[str], filepath: str):
         """Extract lemma/theorem/def declarations"""
-        decl_keywords = {'lemma', 'theorem', 'def', 'axiom', 'example', 'instance', 'structure', 'class'}
-        
-        i = 0
-        while i < len(tokens):
-            if tokens[i] in decl_keywords:
-                # Found a declaration
-                decl_type = tokens[i]
-                
-                # Next non-punctuation token should be the name
-                j = i + 1
-                while j < len(tokens) and not tokens[j].isalnum():
-                    j += 1
-                
-                if j < len(tokens):
-                    name = tokens[j]
-                    
-                    # Store lemma info (simplified - just track start position)
-                    if name not in self.lemmas:
-                        self.lemmas[name] = []
-                    self.lemmas[name].append((filepath, i, decl_type))
-            
-            i += 1
+        self._merge_declarations(_find_declarations(tokens), filepath)
+    
+    def _merge_declarations(self, declarations, filepath: str):
+        for name, i, decl_type in declarations:
+            # Store lemma info (simplified - just track start position)
+            if name not in self.lemmas:
+                self.lemmas[name] = []
+            self.lemmas[name].append((filepath, i, decl_type))
     
     def build_adjacency_list(self, tokens: List[str]):
         """Build adjacency list from token sequence"""
-        for i in range(len(tokens) - 1):
-            curr_id = self.get_word_id(tokens[i])
-            next_id = self.get_word_id(tokens[i + 1])
-            self.adjacency_list[curr_id].add(next_id)
+        self._merge_graph(*_token_graph(tokens))
+    
+    def _merge_graph(self, words: List[str], sources: Tuple[int, ...], targets: Tuple[int, ...]):
+        """Add one file's token graph, as built by _token_graph, to the corpus:
+        register its words in order and translate its edges to their ids."""
+        # get_word_id, inlined. The words are distinct, so the new ones can
+        # be given the next ids in one go and every id read back at C level
+        word_to_id, id_to_word = self.word_to_id, self.id_to_word
+        new_words = [word for word in words if word not in word_to_id]
+        word_to_id.update(zip(new_words, range(len(id_to_word), len(id_to_word) + len(new_words))))
+        id_to_word.extend(new_words)
+        ids = list(map(word_to_id.__getitem__, words))
+        
+        if sources:
+            # Each end of every edge is translated in one batch
+            self._pending_src.extend(_gather(ids, sources))
+            self._pending_dst.extend(_gather(ids, targets))
+            
+            # Most edges recur across files, so fold them in now and then
+            # rather than holding every file's edges until the end
+            if len(self._pending_src) >= _COMPACT_EVERY:
+                self._compact_graph()
+    
+    def _compact_graph(self):
+        """Fold the pending edges into indptr/indices, dropping duplicates,
+        and give every registered word a row, empty if nothing follows it."""
+        indptr, indices = self.indptr, self.indices
+        num_words = len(self.id_to_word)
+        if not self._pending_src and len(indptr) == num_words + 1:
+            return
+        
+        # Every edge, old and new, packed into one int as source << 32 |
+        # target, all at C level. Sorting the distinct keys lays them out
+        # row by row, and no pair tuples are built
+        sources = chain(chain.from_iterable(
+            repeat(w, indptr[w + 1] - indptr[w]) for w in range(len(indptr) - 1)
+        ), self._pending_src)
+        targets = chain(indices, self._pending_dst)
+        edges = sorted(set(map(or_, map(lshift, sources, repeat(32)), targets)))
+        
+        row_sizes = Counter(map(rshift, edges, repeat(32)))
+        self.indptr = array('I', accumulate(map(row_sizes.__getitem__, range(num_words)), initial=0))
+        self.indices = array('I', map(and_, edges, repeat(0xFFFFFFFF)))
+        self._pending_src = array('I')
+        self._pending_dst = array('I')
+    
+    def _load_graph(self, rows):
+        """Rebuild the word graph from (source id, target ids) pairs, whose
+        source ids may be ints or their strings."""
+        rows = list(rows)
+        self.indptr = array('I', [0])
+        self.indices = array('I')
+        self._pending_src = array('I', chain.from_iterable(
+            repeat(int(k), len(v)) for k, v in rows
+        ))
+        self._pending_dst = array('I', chain.from_iterable(map(itemgetter(1), rows)))
+        self._compact_graph()
+    
+    def neighbors(self, word_id: int) -> array:
+        """Ids of the words that follow word_id, sorted"""
+        self._compact_graph()
+        return self.indices[self.indptr[word_id]:self.indptr[word_id + 1]]
+    
+    def has_edge(self, curr_id: int, next_id: int) -> bool:
+        """Whether next_id ever follows curr_id (a binary search of its row)"""
+        self._compact_graph()
+        start, end = self.indptr[curr_id], self.indptr[curr_id + 1]
+        i = bisect_left(self.indices, next_id, start, end)
+        return i < end and self.indices[i] == next_id
     
     def parse_directory(self, directory: str):
         """Parse all LEAN 4 files in directory and subdirectories"""
-        lean_files = list(Path(directory).rglob('*.lean'))
+        lean_files = list(_walk_lean_files(os.fspath(Path(directory))))
         print(f"Found {len(lean_files)} LEAN files")
         
         total_tokens = 0
-        for filepath in lean_files:
-            print(f"Parsing {filepath}")
-            try:
-                tokens = self.tokenize_file(str(filepath))
-                total_tokens += len(tokens)
+        
+        # Files are independent, so they are tokenized and reduced to their
+        # own graphs across all cores; only the merge into the corpus-wide
+        # ids runs here. imap keeps the results in file order, so the ids
+        # are the same as a sequential run would give
+        with _pool_context().Pool(_pool_workers()) as pool:
+            results = pool.imap(_parse_one_file, lean_files, chunksize=8)
+            for filepath, result in zip(lean_files, results):
+                print(f"Parsing {filepath}")
+                if isinstance(result, Exception):
+                    print(f"Error parsing {filepath}: {result}")
+                    continue
+                
+                token_count, declarations, *graph = result
+                total_tokens += token_count
                 
                 # Extract declarations
-                self.extract_declarations(tokens, str(filepath))
+                self._merge_declarations(declarations, filepath)
                 
                 # Build adjacency list
-                self.build_adjacency_list(tokens)
-                
-            except Exception as e:
-                print(f"Error parsing {filepath}: {e}")
+                self._merge_graph(*graph)
+        
+        self._compact_graph()
         
         print(f"\nParsing complete:")
         print(f"  Total tokens: {total_tokens}")
         print(f"  Unique words: {len(self.word_to_id)}")
         print(f"  Declarations found: {len(self.lemmas)}")
-        print(f"  Compression ratio: {total_tokens / len(self.word_to_id):.2f}x")
+        if self.word_to_id:
+            # A tree with no words (empty or comments only) has no ratio
+            print(f"  Compression ratio: {total_tokens / len(self.word_to_id):.2f}x")
+    
+    def parse_declarations(self, directory: str):
+        """Find the declarations in all LEAN 4 files in directory and
+        subdirectories, as parse_directory does, without building the word
+        graph. This is all tally and save_tally need."""
+        lean_files = list(_walk_lean_files(os.fspath(Path(directory))))
+        print(f"Found {len(lean_files)} LEAN files")
+        
+        with _pool_context().Pool(_pool_workers()) as pool:
+            results = pool.imap(_parse_declarations_of_file, lean_files, chunksize=8)
+            for filepath, result in zip(lean_files, results):
+                if isinstance(result, Exception):
+                    print(f"Error parsing {filepath}: {result}")
+                    continue
+                
+                self._merge_declarations(result, filepath)
+        
+        print(f"  Declarations found: {len(self.lemmas)}")
         
     def save(self, output_file: str):
         """Save the compressed representation as JSON"""
-        # Convert sets to lists for JSON serialization
-        adjacency_list_json = {
-            str(k): list(v) for k, v in self.adjacency_list.items()
-        }
-        
-        # Convert integer keys to strings for JSON
-        id_to_word_json = {str(k): v for k, v in self.id_to_word.items()}
+        # Each word's row, for the words that have one, as a [word id,
+        # [target ids]] pair read straight from the graph as it is written;
+        # the words are listed in id order, so neither needs string keys
+        self._compact_graph()
         
         data = {
-            'adjacency_list': adjacency_list_json,
+            'adjacency_list': _GraphRows(self.indptr, self.indices),
             'word_to_id': self.word_to_id,
-            'id_to_word': id_to_word_json,
+            'id_to_word': self.id_to_word,
             'lemmas': self.lemmas,
             'stats': {
                 'unique_words': len(self.word_to_id),
                 'total_declarations': len(self.lemmas),
-                'graph_edges': sum(len(v) for v in self.adjacency_list.values())
+                'graph_edges': len(self.indices)
             }
         }
         
+        # Same file as json.dump(data, f, indent=2, ensure_ascii=False),
+        # streamed out without json's pure-Python indenting encoder
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.writelines(_iter_json(data, '', '  '))
         
         print(f"\nSaved to {output_file}")
         print(f"  File size: {os.path.getsize(output_file) / 1024 / 1024:.2f} MB")
         print(f"  Format: JSON (human-readable)")
     
     def load(self, input_file: str):
-        """Load compressed representation from JSON"""
+        """Load compressed representation from JSON, through a pickle sidecar
+        next to it.
+        
+        The sidecar records the size and mtime of the JSON it was made from
+        and is rebuilt whenever they change; unpickling the parser's arrays
+        and dicts is many times faster than parsing the JSON again. Where the
+        sidecar cannot be written, the JSON is simply parsed every time.
+        """
+        stat = os.stat(input_file)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        cache_file = Path(f"{input_file}.pickle")
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_stamp, stats, state = pickle.load(f)
+        except (OSError, EOFError, TypeError, ValueError, pickle.UnpicklingError):
+            # Missing or unreadable; rebuilt below
+            cached_stamp = None
+        
+        if cached_stamp == stamp:
+            vars(self).update(state)
+        else:
+            stats = self._load_json(input_file)
+            
+            # A failure to write the sidecar (a read-only directory, say) only
+            # costs a JSON parse next load, so it is not reported
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump((stamp, stats, vars(self)), f, protocol=pickle.HIGHEST_PROTOCOL)
+                # Atomic, so a concurrent reader never sees a partial file
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+        
+        print(f"Loaded from {input_file}")
+        print(f"  Unique words: {len(self.word_to_id)}")
+        print(f"  Declarations: {len(self.lemmas)}")
+        if stats is not None:
+            print(f"  Graph edges: {stats['graph_edges']}")
+    
+    def _load_json(self, input_file: str) -> Optional[Dict]:
+        """Read the JSON written by save into this parser, and return its
+        stats, if it has any"""
         with open(input_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
-        # Convert adjacency list back to defaultdict with sets
-        self.adjacency_list = defaultdict(set)
-        for k, v in data['adjacency_list'].items():
-            self.adjacency_list[int(k)] = set(v)
-        
         self.word_to_id = data['word_to_id']
         
-        # Convert string keys back to integers
-        self.id_to_word = {int(k): v for k, v in data['id_to_word'].items()}
+        self.id_to_word = data['id_to_word']
+        rows = data['adjacency_list']
+        if isinstance(self.id_to_word, dict):
+            # Written when both were keyed by the ids' strings
+            self.id_to_word = [self.id_to_word[str(k)] for k in range(len(self.id_to_word))]
+            rows = rows.items()
+        
+        # Rebuild the word graph from its rows
+        self._load_graph(rows)
         
         self.lemmas = data['lemmas']
+        self._clear_name_index()
         
-        print(f"Loaded from {input_file}")
-        print(f"  Unique words: {len(self.word_to_id)}")
-        print(f"  Declarations: {len(self.lemmas)}")
-        if 'stats' in data:
-            print(f"  Graph edges: {data['stats']['graph_edges']}")
+        return data.get('stats')
+    
+    def _clear_name_index(self):
+        """Forget the trigram index of the lemma names"""
+        self._lemma_names = []  # The names indexed so far, in lemmas order
+        self._name_trigrams = {}  # Trigram -> indices into _lemma_names
+    
+    def _update_name_index(self):
+        """Index the lemma names added since the last query by their
+        trigrams. Names are only ever added, so earlier entries stay valid."""
+        names, trigrams = self._lemma_names, self._name_trigrams
+        for name in islice(self.lemmas, len(names), None):
+            i = len(names)
+            names.append(name)
+            for trigram in dict.fromkeys(name[k:k + 3] for k in range(len(name) - 2)):
+                trigrams.setdefault(trigram, []).append(i)
+    
+    def tally(self) -> List[Dict]:
+        """The lemma, theorem and def declarations found while parsing, as
+        the entries of tally_lean4_lemmas.py's JSON, grouped by file in path
+        order and in token order within each file.
+        
+        A declaration is one of those keywords as a whole token followed,
+        past any punctuation, by an alphanumeric name, as extract_declarations
+        finds them. A keyword at the end of a longer word (the def of
+        undef) or with no name after it is not counted, so this can come
+        out lower than the substring count the tally script used to make.
+        """
+        locations = sorted(
+            (filepath, i, decl_type)
+            for name_locations in self.lemmas.values()
+            for filepath, i, decl_type in name_locations
+            if decl_type in _TALLY_TYPES
+        )
+        return [
+            {"definition_type": decl_type, "file": filepath, "line_number": "-"}
+            for filepath, _, decl_type in locations
+        ]
+    
+    def save_tally(self, output_file: str):
+        """Save the tally of declarations (see tally) in the JSON format of
+        tally_lean4_lemmas.py, so a single pass over the files gives both"""
+        definitions = self.tally()
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.writelines(_iter_json(definitions, '', '    '))
+        
+        print(f"\n{len(definitions)} definitions >> [{output_file}]")
+        
+        # Show summary
+        summary = Counter(d['definition_type'] for d in definitions)
+        print("\nSummary:")
+        for dt, count in summary.items():
+            print(f"  {dt}s: {count}")
     
     def find_lemmas_with_word(self, word: str) -> List[str]:
         """Find all lemmas containing a specific word"""
         if word not in self.word_to_id:
             return []
         
-        word_id = self.word_to_id[word]
-        result = []
+        self._update_name_index()
+        names = self._lemma_names
+        
+        if len(word) < 3:
+            # Too short to have a trigram; check every name
+            return [name for name in names if word in name]
         
-        # Check which lemmas have edges from/to this word
-        for lemma_name, locations in self.lemmas.items():
-            # This is a simple heuristic - in practice you'd want to
-            # actually check the token sequence around the lemma
-            if lemma_name.find(word) != -1:
-                result.append(lemma_name)
+        # A name holding the word holds all of its trigrams, so only the
+        # names on every trigram's list are checked, rarest list first
+        postings = []
+        for trigram in {word[k:k + 3] for k in range(len(word) - 2)}:
+            if trigram not in self._name_trigrams:
+                return []
+            postings.append(self._name_trigrams[trigram])
+        postings.sort(key=len)
         
-        return result
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return [names[i] for i in sorted(candidates) if word in names[i]]
     
     def get_word_neighbors(self, word: str) -> Dict[str, int]:
         """Get words that frequently follow a given word"""
@@ -173,38 +601,21 @@ class Lean4Parser:
         word_id = self.word_to_id[word]
         neighbors = {}
         
-        for next_id in self.adjacency_list[word_id]:
+        for next_id in self.neighbors(word_id):
             next_word = self.id_to_word[next_id]
             neighbors[next_word] = neighbors.get(next_word, 0) + 1
         
         return dict(sorted(neighbors.items(), key=lambda x: x[1], reverse=True))
     
     def find_pattern(self, pattern: List[str]) -> int:
-        """Count occurrences of a word pattern"""
-        if not pattern or pattern[0] not in self.word_to_id:
+        """Count occurrences of a word pattern. The graph keeps no edge
+        counts, so this is 1 if each word follows the one before it, else 0"""
+        word_ids = [self.word_to_id.get(word) for word in pattern]
+        if len(word_ids) < 2 or None in word_ids:
             return 0
         
-        count = 0
-        current_ids = {self.word_to_id[pattern[0]]}
-        
-        for i in range(1, len(pattern)):
-            if pattern[i] not in self.word_to_id:
-                return 0
-            
-            next_id = self.word_to_id[pattern[i]]
-            new_current = set()
-            
-            for curr_id in current_ids:
-                if next_id in self.adjacency_list[curr_id]:
-                    new_current.add(next_id)
-                    if i == len(pattern) - 1:
-                        count += 1
-            
-            current_ids = new_current
-            if not current_ids:
-                break
-        
-        return count
+        # Each step only ever continues from the pattern's own previous word
+        return int(all(self.has_edge(curr_id, next_id) for curr_id, next_id in pairwise(word_ids)))
 
 
 # Example usage
@@ -214,6 +625,7 @@ if __name__ == "__main__":
     # Example: Parse a Lean 4 project
     # parser.parse_directory("/path/to/mathlib4")
     # parser.save("lean4_corpus.json")
+    # parser.save_tally("total_lean4_lemmas.json")
     
     # Example: Load and query
     # parser.load("lean4_corpus.json")
@@ -230,7 +642,7 @@ if __name__ == "__main__":
     # count = parser.find_pattern(["by", "simp"])
     # print(f"Pattern 'by simp' appears {count} times")
     
-    print("Parser ready to begin.\n\nUsage: lean_parser.py <directory> <output_file.json>")
+    print("Parser ready to begin.\n\nUsage: lean_parser.py <directory> <output_file.json> [tally_file.json]")
 
 def main():
     import sys
@@ -238,7 +650,7 @@ def main():
     all_params = len(sys.argv)
 
     if all_params < 2:
-        print("Usage: python3 lean_parser.py <directory> <output_file.json>")
+        print("Usage: python3 lean_parser.py <directory> <output_file.json> [tally_file.json]")
         sys.exit(1)
     
     directory = sys.argv[1]
@@ -250,6 +662,10 @@ def main():
 
     parser.parse_directory(directory)
     parser.save(output_file)
+    
+    # The declaration tally comes from the same pass
+    if all_params > 3:
+        parser.save_tally(sys.argv[3])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,78 +1,42 @@
+"""
+Tally the lemma, theorem and def declarations in a tree of LEAN 4 files.
 
-import re
-import json
-from pathlib import Path
+A thin wrapper over lean4_parser_v8's Lean4Parser.parse_declarations, the
+declaration half of its parse pass, without the word graph. Running
+`lean4_parser_v8.py <directory> <output.json> <tally.json>` writes the same
+tally alongside the parser's corpus in one pass.
 
-def parse_lean_files(directory):
-    """Parse all .lean files recursively and extract all lemmas, theorems, and defs for an upper bound."""
+A declaration is a keyword token followed by a name (see Lean4Parser.tally),
+so keywords that end a longer word or have no name after them are not
+counted, and the totals can come out below the upper bound earlier versions
+of this script gave. Entries are grouped by file in path order, not in the
+order the tree is walked.
+"""
 
-    results = []
-
-    # Pattern to match lemma/theorem/def declarations
-    pattern = re.compile(
-        r'(?P<def_type>lemma|theorem|def)\s+',  # Declaration type
-        re.MULTILINE | re.DOTALL
-    )
-
-    # Find all .lean files recursively
-    for lean_file in Path(directory).rglob("*.lean"):
-        try:
-            with open(lean_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Remove comments for cleaner parsing
-            content = re.sub(r'--[^\n]*', '', content)
-            content = re.sub(r'/-.*?-/', '', content, flags=re.DOTALL)
-            
-            # Find all matches
-            for match in pattern.finditer(content):
-                def_type = match.group('def_type')
-                
-                entry = {
-                    "definition_type": def_type,
-                    "file": str(lean_file),
-                    "line_number": "-"
-                }
-                
-                results.append(entry)
-        except Exception as e:
-            print(f"Error processing {lean_file}: {e}")
-            continue
-
-    return results
+from lean4_parser_v8 import Lean4Parser
 
 def main():
     import sys
 
-    if len(sys.argv) < 2:
-        print("Usage: python3 lean_parser.py <directory> <filename.json>")
+    if len(sys.argv) < 3:
+        print("Usage: python3 tally_lean4_lemmas.py <directory> <filename.json>")
         sys.exit(1)
 
     directory = sys.argv[1]
     output_file = sys.argv[2]
 
     print(f"Parsing LEAN files in {directory}...")
-    definitions = parse_lean_files(directory)
+    parser = Lean4Parser()
+    parser.parse_declarations(directory)
     
-    # Save to JSON with nice formatting
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(definitions, f, indent=4, ensure_ascii=False)
-    
-    print(f"\n{len(definitions)} definitions >> [{output_file}]")
-
-    # Show summary
-    summary = {}
-    for d in definitions:
-        dt = d['definition_type']
-        summary[dt] = summary.get(dt, 0) + 1
-
-    print("\nSummary:")
-    for dt, count in summary.items():
-        print(f"  {dt}s: {count}")
+    # Save to JSON with nice formatting, and show the summary
+    parser.save_tally(output_file)
 
 if __name__ == "__main__":
     main()
 
+# From a run of the earlier, regex-based version of this script, which also
+# counted keywords that end longer words or have no name after them
 Notes = '''
 367062 definitions >> [total_lean4_lemmas.json]
 
@@ -80,4 +44,4 @@ Summary:
   theorem: 228904
   def: 61534
   lemma: 76624
-'''
\ No newline at end of file
+'''
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the pickle sidecar behind lean4_parser_utils' JSON loading
+"""
+
+import os
+import json
+import stat
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from lean4_parser_utils import _read_definitions
+
+DEFINITIONS = [{
+    "title": "mul_comm",
+    "definition_type": "lemma",
+    "type_instance_definitions": "[CommMonoid M] (a b : M)",
+    "local_instances": [],
+    "proof": ["a * b = b * a"]
+}]
+
+class ReadDefinitionsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.json_file = os.path.join(self.tmp.name, "definitions.json")
+        with open(self.json_file, 'w', encoding='utf-8') as f:
+            json.dump(DEFINITIONS, f)
+
+    def read_quietly(self):
+        out = StringIO()
+        with redirect_stdout(out):
+            definitions = _read_definitions(self.json_file)
+        self.assertEqual(out.getvalue(), "")
+        return definitions
+
+    def test_sidecar_is_written_and_reused(self):
+        self.assertEqual(self.read_quietly(), DEFINITIONS)
+        self.assertTrue(os.path.exists(f"{self.json_file}.pickle"))
+        self.assertEqual(self.read_quietly(), DEFINITIONS)
+
+    @unittest.skipIf(hasattr(os, 'geteuid') and os.geteuid() == 0,
+                     "root can write to read-only directories")
+    def test_unwritable_directory_is_a_silent_miss(self):
+        os.chmod(self.tmp.name, stat.S_IRUSR | stat.S_IXUSR)
+        self.addCleanup(os.chmod, self.tmp.name, stat.S_IRWXU)
+
+        self.assertEqual(self.read_quietly(), DEFINITIONS)
+        self.assertEqual(os.listdir(self.tmp.name), ["definitions.json"])
+
+    def test_failed_sidecar_write_is_a_silent_miss(self):
+        # A directory in the way of the temporary file makes the write fail
+        # even for root
+        os.mkdir(f"{self.tmp.name}/definitions.json.{os.getpid()}.tmp")
+
+        self.assertEqual(self.read_quietly(), DEFINITIONS)
+        self.assertFalse(os.path.exists(f"{self.json_file}.pickle"))
+
+if __name__ == "__main__":
+    unittest.main()